@@ -21,8 +21,9 @@
 
 # Dependencies: 
 # - ODAFileConverter
-# - Inkscape
+# - Inkscape 1.x (by inkscape_shell.py)
 # - pstoedit
+# - ezdxf (by freestyle_svg.py, just for tiled renders by -t)
 
 
 ## TODO: make universal (no fixed layer names). Use just first 8 colors:
@@ -33,12 +34,17 @@
 ## ...
 ## bpy.data.linestyles["LineStyle.002"].color -> Color((1.0, 1.0, 0.0))
 
-import sys
+import os, sys
 import bpy
 import bmesh
 import subprocess, shlex
 import re
 
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import dxf_stream
+import inkscape_shell
+import work_queue
+
 
 oda_file_converter = '/usr/bin/ODAFileConverter'
 args = [arg for arg in sys.argv[sys.argv.index("--") + 1:]]
@@ -50,6 +56,8 @@ layers = {'cut': ['C00-FF-FF'],
         'back': ['C00-00-FF'],
         '0': ['CFF-FF-FF-WHITE', 'C00-00-00-BLACK'],
         }
+## Color layer names by pstoedit to layer names
+layer_names = {lay: layer for layer in layers for lay in layers[layer]}
 
 selection = bpy.context.selected_objects
 active = bpy.context.view_layer.objects.active
@@ -61,6 +69,28 @@ if factor_marker in args:
     print('### Render factor:', large_render_factor)
     del args[factor_index - 1 : factor_index + 1]
 
+## Render cameras in parallel by jobs background Blender workers
+jobs_marker = '-j'
+jobs = 1
+if jobs_marker in args:
+    jobs_index = args.index(jobs_marker) + 1
+    jobs = int(args[jobs_index])
+    del args[jobs_index - 1 : jobs_index + 1]
+
+## Render tiles x tiles sub frames and stitch them in one svg
+tiles_marker = '-t'
+tiles = 1
+if tiles_marker in args:
+    tiles_index = args.index(tiles_marker) + 1
+    tiles = int(args[tiles_index])
+    del args[tiles_index - 1 : tiles_index + 1]
+
+worker_address = None
+if work_queue.WORKER_MARKER in args:
+    worker_index = args.index(work_queue.WORKER_MARKER) + 1
+    worker_address = args[worker_index]
+    del args[worker_index - 1 : worker_index + 1]
+
 if not args:
     cams = [obj for obj in selection if obj.type == 'CAMERA']
 else:
@@ -95,6 +125,63 @@ def finalize_render(render_name):
 
     renders.append(render_name)
 
+def render_view(cam, render_name):
+    ''' Render cam view to render_name svg, by tiles if required '''
+    bpy.context.scene.camera = cam
+    if tiles == 1:
+        bpy.context.scene.render.filepath = render_name
+        bpy.ops.render.render()
+        finalize_render(render_name)
+        return
+
+    ## Every tile is a camera of a sub frame: Freestyle culling keeps its
+    ## view map to the objects in it
+    render = bpy.context.scene.render
+    ortho_scale = cam.data.ortho_scale
+    shift = (cam.data.shift_x, cam.data.shift_y)
+    resolution = (render.resolution_x, render.resolution_y,
+            render.resolution_percentage)
+    use_culling = freestyle_settings.use_culling
+    ## Tiles get whole pixels of the untiled frame so that scale is kept:
+    ## last column and row take the remainder
+    size = render.resolution_x * render.resolution_percentage // 100
+    tile_size = size // tiles
+    tile_sizes = [tile_size] * (tiles - 1) + [size - tile_size * (tiles - 1)]
+    pixel = ortho_scale / size
+    render.resolution_percentage = 100
+    freestyle_settings.use_culling = True
+    tile_svgs = []
+    for i in range(tiles):
+        for j in range(tiles):
+            width, height = tile_sizes[i], tile_sizes[j]
+            render.resolution_x, render.resolution_y = width, height
+            ## Ortho scale and shift refer to the larger side of the frame
+            cam.data.ortho_scale = pixel * max(width, height)
+            ## Tile center from left and top edges of the untiled frame
+            cam.data.shift_x = ((shift[0] - .5) * ortho_scale + 
+                    (i * tile_size + width / 2) * pixel) / cam.data.ortho_scale
+            cam.data.shift_y = ((shift[1] + .5) * ortho_scale - 
+                    (j * tile_size + height / 2) * pixel) / cam.data.ortho_scale
+            tile_name = '{}_tile_{}_{}'.format(render_name, i, j)
+            render.filepath = tile_name
+            bpy.ops.render.render()
+            ## Svg y axis points down
+            tile_svgs.append((tile_name + frame + '.svg', 
+                (i * tile_size, j * tile_size)))
+
+    cam.data.ortho_scale = ortho_scale
+    cam.data.shift_x, cam.data.shift_y = shift
+    render.resolution_x, render.resolution_y, \
+            render.resolution_percentage = resolution
+    freestyle_settings.use_culling = use_culling
+
+    ## Just tiled renders need freestyle_svg (and ezdxf it imports)
+    import freestyle_svg
+    freestyle_svg.stitch_svgs(tile_svgs, render_name + '.svg', (size, size))
+    for tile_svg, offset in tile_svgs:
+        os.remove(tile_svg)
+    renders.append(render_name)
+
 def back_render(cam, render_filename):
     bpy.ops.object.select_all(action='DESELECT')
     cam.select_set(True)
@@ -107,8 +194,7 @@ def back_render(cam, render_filename):
         if ls.name == 'Back':
             ls.show_render = True
 
-    bpy.context.scene.render.filepath = render_filename + back_label
-    bpy.ops.render.render()
+    render_view(cam, render_filename + back_label)
 
     ## Reset to start conditions (for non back view)
     set_back(cam, 1)
@@ -120,8 +206,6 @@ def back_render(cam, render_filename):
        obj.select_set(True)
     bpy.context.view_layer.objects.active = active
 
-    finalize_render(render_filename + back_label)
-
 def render_cam(cam):
     render_scale = round(100 * cam.data.ortho_scale/base_ortho_scale)
     bpy.context.scene.render.resolution_percentage = render_scale
@@ -139,11 +223,7 @@ def render_cam(cam):
                 ls.show_render = True
 
 
-    bpy.context.scene.render.filepath = render_filename
-    bpy.context.scene.camera = cam
-    bpy.ops.render.render()
-
-    finalize_render(render_filename)
+    render_view(cam, render_filename)
 
 
     ## Render back view if needed
@@ -159,47 +239,69 @@ def svg2dwg(render):
     eps = render + '.eps'
     dxf = render + '.dxf'
 
-    ## Run with Inkscape 0.92
-    subprocess.run(['inkscape', '-f', svg, '-C', '-E', eps])
-
-    ## Run with Inkscape 1.0
-    ## subprocess.run(['inkscape', svg, '-C', '-o', eps])
+    try:
+        inkscape_shell.export(svg, eps)
+    except (RuntimeError, ChildProcessError, TimeoutError) as e:
+        print('Export of', svg, 'failed:', e)
+        return
 
     svg2dxf = "pstoedit -xscale {} -yscale {} -dt -f ".format(
             str(large_render_factor), str(large_render_factor)) + \
                     "'dxf_s:-polyaslines -ctl -mm' {} {}".format(eps, dxf)
     subprocess.run(svg2dxf, shell=True) 
 
-    print('Get dxf content from', dxf)
-    dxf_f = open(dxf, 'rt')
-    dxf_data = dxf_f.read()
-    for layer in layers:
-        for lay in layers[layer]:
-            print('Replace', lay, 'with', layer)
-            dxf_data = dxf_data.replace(lay, layer)
-    dxf_f.close()
-    dxf_f = open(dxf, 'wt')
-    print('Rewrite', dxf)
-    dxf_f.write(dxf_data)
-    dxf_f.close()
+    print('Rename layers of', dxf)
+    dxf_stream.rewrite_dxf(dxf, entities=(), attribs={}, layers=layer_names)
 
     subprocess.run([oda_file_converter, path, path, 'ACAD2013', 'DWG', 
         '0', '1', render[len(path):] + '.dxf'])
     subprocess.run(['rm', svg, eps, dxf])
 
+def process_cam(cam):
+    global renders
+    render_cam(cam)
+
+    for render in renders:
+        svg2dwg(render)
+
+    ## Reset renders to []
+    renders = []
+
+def work():
+    ''' Process cameras got from coordinator '''
+    jobs_queue, results_queue = work_queue.connect(worker_address)
+    for cam_name in work_queue.get_jobs(jobs_queue):
+        print('### Worker takes', cam_name)
+        process_cam(bpy.data.objects[cam_name])
+        results_queue.put(cam_name)
+
+def coordinate():
+    ''' Let jobs background Blender workers process cams '''
+    address, results_queue = work_queue.serve([cam.name for cam in cams])
+    print('### Process', len(cams), 'cameras with', jobs, 'workers')
+    return_codes = work_queue.run_blender_workers(jobs, bpy.app.binary_path, 
+            bpy.data.filepath, os.path.realpath(__file__), 
+            [factor_marker, str(large_render_factor), tiles_marker, str(tiles)], 
+            address)
+    done = work_queue.get_results(results_queue)
+    for cam in cams:
+        if cam.name not in done:
+            print('### NOT PROCESSED:', cam.name)
+    print('### Workers exit codes:', return_codes)
+
 def main():
     bpy.ops.object.select_all(action='DESELECT')
     bpy.ops.object.bevel_switcher(mode='allOFF')
-    global renders
 
-    for cam in cams:
-        render_cam(cam)
-        
-        for render in renders:
-            svg2dwg(render)
+    if worker_address:
+        work()
+        return
+    if jobs > 1:
+        coordinate()
+        return
 
-        ## Reset renders to []
-        renders = []
+    for cam in cams:
+        process_cam(cam)
 
 
 main()
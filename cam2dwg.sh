@@ -1,3 +1,3 @@
 #!/bin/bash
 
-~/softwares/blender290/blender --background $1 --python ~/softwares/scripts/cam2dwg.py -- $2
+~/softwares/blender290/blender --background $1 --python ~/softwares/scripts/cam2dwg.py -- ${@:2}
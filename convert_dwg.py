@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*- 
 
-import ezdxf
 import os, sys
 import pathlib
 import subprocess
+import dxf_stream
 
 args = sys.argv[1:]
 paths = [pathlib.Path(d).absolute() for d in args]
@@ -18,8 +18,7 @@ for path in paths:
             if name.endswith(".dxf"):
                 dxf = root + os.sep + name
                 print('Converting', dxf)
-                dxf_file = ezdxf.readfile(dxf, 'utf-8')
-                dxf_file.saveas(dxf)
+                dxf_stream.rewrite_dxf(dxf, attribs={})
     subprocess.run([ODA_FILE_CONVERTER, path, path, 'ACAD2010', 'DWG', '1', '1',
         '*.dxf'])
     for root, dirs, files in os.walk(path):
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019 Marco Ferrara
+
+# License:
+# GNU GPL License
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Purpose:
+# Patch DXF files group code by group code in a single pass: set attributes
+# of entities, rename layers and write the file with the encoding of its code
+# page, without loading the whole drawing
+
+import codecs
+import os
+
+BYBLOCK = {6: 'ByBlock', 370: '-2'} ## Linetype and lineweight
+LINEWEIGHT_CODE = 370
+R12 = 'AC1009' ## No lineweights before R2000
+R2007 = 'AC1021' ## DXF are utf-8 from R2007 on
+DEFAULT_CODEPAGE = 'ANSI_1252'
+
+def escape_unicode(error):
+    ''' Write characters missing in code page as \\U+XXXX like AutoCAD '''
+    return ''.join('\\U+{:04X}'.format(ord(char))
+            for char in error.object[error.start:error.end]), error.end
+
+codecs.register_error('dxf_unicode', escape_unicode)
+
+def get_encoding(version, codepage):
+    ''' Get the python encoding of dxf with version and codepage '''
+    if version and version >= R2007:
+        return 'utf-8'
+    codepage = (codepage or DEFAULT_CODEPAGE).upper()
+    if codepage.startswith('ANSI_'):
+        return 'cp' + codepage[5:]
+    if codepage.replace('-', '') == 'UTF8':
+        return 'utf-8'
+    return 'cp1252'
+
+def read_pairs(dxf_file):
+    ''' Yield (code, value) pairs of dxf_file lines '''
+    for code in dxf_file:
+        value = next(dxf_file, '')
+        yield int(code), value.rstrip('\r\n')
+
+def read_header(dxf):
+    ''' Get $ACADVER and $DWGCODEPAGE (None if missing) of dxf, reading 
+        just its HEADER section '''
+    version = codepage = variable = None
+    ## Header variables are ascii: latin-1 reads any byte
+    with open(dxf, encoding='latin-1') as dxf_file:
+        for code, value in read_pairs(dxf_file):
+            if code == 9:
+                variable = value
+            elif code != 0 and variable == '$ACADVER':
+                version = value.strip()
+            elif code != 0 and variable == '$DWGCODEPAGE':
+                codepage = value.strip()
+            elif (code, value) == (0, 'ENDSEC'):
+                break
+    return version, codepage
+
+def patch_entity(pairs, attribs):
+    ''' Set attribs on entity pairs, adding the missing ones after layer '''
+    if any(code == 67 and value.strip() == '1' for code, value in pairs):
+        ## Paper space entity
+        return pairs
+    missing = dict(attribs)
+    patched = [(code, missing.pop(code) if code in missing else value)
+            for code, value in pairs]
+    layer = next((i for i, (code, value) in enumerate(patched) if code == 8), 0)
+    patched[layer + 1:layer + 1] = list(missing.items())
+    return patched
+
+def rename_layer(pairs, layers, names):
+    ''' Rename LAYER table entry pairs by layers (old name: new name). Drop 
+        the entry if its new name is in names '''
+    pairs = [(code, layers.get(value, value) if code == 2 else value)
+            for code, value in pairs]
+    name = next((value for code, value in pairs if code == 2), None)
+    if name in names:
+        return []
+    names.add(name)
+    return pairs
+
+def rewrite_dxf(dxf, output = None, entities = ('LINE',), attribs = BYBLOCK,
+        layers = {}, encoding = 'utf-8'):
+    ''' Set attribs (group code: value) on entities of the ENTITIES section
+        of dxf, rename layers (old name: new name) and write it to output 
+        (dxf itself by default) with the encoding of its code page. Dxf is 
+        read with the encoding of its version and code page, or with 
+        encoding if it has no code page (e.g. by pstoedit) '''
+    output = output or dxf
+    layer_names = set()
+    tmp = output + '.tmp'
+    version, codepage = read_header(dxf)
+    if codepage or version and version >= R2007:
+        encoding = get_encoding(version, codepage)
+    version = codepage = None
+    section = variable = None
+    out_encoding = None
+    pending = [] ## Pairs waiting for the encoding given by the header
+    entity = []
+    with open(dxf, encoding=encoding, errors='replace') as dxf_file, \
+            open(tmp, 'wb') as tmp_file:
+
+        def write(pairs):
+            tmp_file.write(''.join('{:>3}\n{}\n'.format(code, value)
+                for code, value in pairs).encode(out_encoding, 'dxf_unicode'))
+
+        for code, value in read_pairs(dxf_file):
+            if code == 0 and entity:
+                if entity[0] == (0, 'LAYER'):
+                    write(rename_layer(entity, layers, layer_names))
+                else:
+                    write(patch_entity(entity, {key: attribs[key]
+                        for key in attribs if key != LINEWEIGHT_CODE or
+                        version and version > R12}))
+                entity = []
+            if code == 8:
+                value = layers.get(value, value)
+
+            if section == 'HEADER':
+                if code == 9:
+                    variable = value
+                elif code != 0 and variable == '$ACADVER':
+                    version = value.strip()
+                elif code != 0 and variable == '$DWGCODEPAGE':
+                    codepage = value.strip()
+                elif (code, value) == (0, 'ENDSEC'):
+                    if not codepage and (not version or version < R2007):
+                        codepage = DEFAULT_CODEPAGE
+                        pending += [(9, '$DWGCODEPAGE'), (3, codepage)]
+                    section = None
+
+            if code == 0 and value == 'SECTION':
+                section = ''
+            elif code == 2 and section == '':
+                section = value
+
+            if out_encoding is None:
+                if section in ('', 'HEADER'):
+                    pending.append((code, value))
+                    continue
+                out_encoding = get_encoding(version, codepage)
+                write(pending)
+                pending = []
+
+            if section == 'ENTITIES' and (entity or
+                    code == 0 and value in entities) or \
+                    section == 'TABLES' and layers and (entity or
+                    (code, value) == (0, 'LAYER')):
+                entity.append((code, value))
+            else:
+                write([(code, value)])
+
+        if out_encoding is None:
+            out_encoding = get_encoding(version, codepage)
+        write(pending + entity)
+    os.replace(tmp, output)
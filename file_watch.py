@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019 Marco Ferrara
+
+# License:
+# GNU GPL License
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Purpose:
+# Watch folders for saved, moved and deleted files by inotify (Linux) or by
+# polling their content, and get changes in batches once saves calm down
+
+import ctypes, ctypes.util
+import os
+import select
+import struct
+import time
+
+DEBOUNCE = 1.5 ## Seconds without events closing a batch of changes
+POLL_INTERVAL = 1
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_DELETE = 0x200
+IN_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII') ## wd, mask, cookie, len
+
+class InotifyWatcher:
+    ''' Watch folders by inotify '''
+
+    def __init__(self, folders):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self.folders = {}
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), 'Can\'t watch ' + folder)
+            self.folders[wd] = folder
+
+    def wait(self, timeout = None):
+        ''' Get paths changed within timeout (forever if None) '''
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        i = 0
+        while i < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, i)
+            i += EVENT_HEADER.size
+            name = data[i:i + length].rstrip(b'\0')
+            i += length
+            if wd in self.folders and name:
+                paths.append(os.path.join(self.folders[wd], os.fsdecode(name)))
+        return paths
+
+class PollingWatcher:
+    ''' Watch folders by comparing size and time of their files '''
+
+    def __init__(self, folders, interval = POLL_INTERVAL):
+        self.folders = folders
+        self.interval = interval
+        self.files = self.scan()
+
+    def scan(self):
+        ''' Get (modification time, size) of files in folders '''
+        files = {}
+        for folder in self.folders:
+            for entry in os.scandir(folder):
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_mtime, stat.st_size)
+        return files
+
+    def wait(self, timeout = None):
+        ''' Get paths changed within timeout (forever if None) '''
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            time.sleep(self.interval if end is None else
+                    max(0, min(self.interval, end - time.time())))
+            files = self.scan()
+            paths = [path for path in set(files) | set(self.files)
+                    if files.get(path) != self.files.get(path)]
+            self.files = files
+            if paths or end is not None and time.time() >= end:
+                return paths
+
+def get_watcher(folders, polling = False):
+    ''' Get an inotify watcher of folders, or a polling one if inotify is not
+        available or polling (e.g. for network shares) '''
+    if not polling:
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError, TypeError) as e:
+            print('Inotify not available, poll folders:', e)
+    return PollingWatcher(folders)
+
+def watch(folders, suffix = '', debounce = DEBOUNCE, polling = False):
+    ''' Yield sets of paths ending with suffix changed (saved, moved or
+        deleted) in folders, once no event comes for debounce seconds '''
+    watcher = get_watcher(folders, polling)
+    changes = set()
+    while True:
+        paths = watcher.wait(debounce if changes else None)
+        changes |= {path for path in paths if path.endswith(suffix)}
+        if changes and not paths:
+            yield changes
+            changes = set()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019 Marco Ferrara
+
+# License:
+# GNU GPL License
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Purpose:
+# Read the SVG files written by Blender Freestyle and convert them to DXF
+# without external programs
+
+# Dependencies:
+# - ezdxf
+# - Inkscape 1.x (by inkscape_shell.py) and pstoedit (just for SVG not made 
+#   by Freestyle)
+
+import os
+import re
+import subprocess
+import time
+import xml.etree.ElementTree as ET
+import ezdxf
+from ezdxf.addons import Importer
+import dxf_stream
+import inkscape_shell
+
+PX_TO_MM = 25.4 / 96.0 ## Inkscape resolution is 96 dpi
+SVG_NS = 'http://www.w3.org/2000/svg'
+INKSCAPE_NS = 'http://www.inkscape.org/namespaces/inkscape'
+PATH_TOKEN_RE = re.compile(
+        r'([A-Za-z])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+RGB_RE = re.compile(r'rgb\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)')
+LENGTH_RE = re.compile(r'([\d\.]+)\s*(px)?$')
+## Elements Freestyle never writes: leave them to Inkscape
+UNSUPPORTED_TAGS = {'line', 'polyline', 'polygon', 'rect', 'circle',
+        'ellipse', 'text', 'image', 'use'}
+DXF_LAYER = '0'
+DXF_BLACK = 7
+BLOCK_NAME_RE = re.compile(r'[<>/\\":;?*|=`,]') ## Not allowed in block names
+
+def local_tag(element):
+    ''' Get the tag of element without namespace '''
+    return element.tag.rsplit('}', 1)[-1]
+
+def get_color(stroke):
+    ''' Convert svg stroke color to rgb tuple '''
+    if not stroke or stroke == 'none':
+        return (0, 0, 0)
+    rgb = RGB_RE.match(stroke)
+    if rgb:
+        return tuple(int(c) for c in rgb.groups())
+    if stroke.startswith('#') and len(stroke) == 7:
+        return tuple(int(stroke[i:i+2], 16) for i in (1, 3, 5))
+    if stroke.startswith('#') and len(stroke) == 4:
+        return tuple(17 * int(c, 16) for c in stroke[1:])
+    if stroke == 'black':
+        return (0, 0, 0)
+    raise ValueError('Unsupported color {}'.format(stroke))
+
+def get_length(value):
+    ''' Convert svg width and height to pixels '''
+    length = LENGTH_RE.match(value.strip())
+    if not length:
+        raise ValueError('Unsupported length {}'.format(value))
+    return float(length.group(1))
+
+def parse_path(d):
+    ''' Split path data d in polylines as (points, closed) '''
+    polylines = []
+    points = []
+    command = None
+    current = (0.0, 0.0)
+    start = current
+    values = []
+    for token in PATH_TOKEN_RE.finditer(d):
+        if token.group(1):
+            command = token.group(1)
+            if command in 'Zz':
+                if len(points) > 1:
+                    polylines.append((points, True))
+                points = [start]
+                current = start
+            elif command not in 'MmLlHhVv':
+                raise ValueError('Unsupported path command {}'.format(command))
+            continue
+        if command is None or command in 'Zz':
+            raise ValueError('Path data without command')
+        values.append(float(token.group(2)))
+        if command in 'HhVv':
+            value = values.pop()
+            if command == 'H':
+                current = (value, current[1])
+            elif command == 'h':
+                current = (current[0] + value, current[1])
+            elif command == 'V':
+                current = (current[0], value)
+            else:
+                current = (current[0], current[1] + value)
+            points.append(current)
+            continue
+        if len(values) < 2:
+            continue
+        x, y = values
+        values = []
+        if command.islower():
+            x, y = current[0] + x, current[1] + y
+        current = (x, y)
+        if command in 'Mm':
+            if len(points) > 1:
+                polylines.append((points, False))
+            points = [current]
+            start = current
+            ## Following pairs are implicit lineto
+            command = 'l' if command == 'm' else 'L'
+        else:
+            points.append(current)
+    if len(points) > 1:
+        polylines.append((points, False))
+    return polylines
+
+def get_paths(svg):
+    ''' Yield (polylines, rgb color) for each path of svg and the svg size
+        as first item '''
+    size = None
+    for event, element in ET.iterparse(svg, events=('start', 'end')):
+        tag = local_tag(element)
+        if event == 'start':
+            if tag == 'svg' and size is None:
+                size = (get_length(element.get('width')),
+                        get_length(element.get('height')))
+                yield size
+            if tag in UNSUPPORTED_TAGS:
+                raise ValueError('Unsupported element {}'.format(tag))
+            if element.get('transform'):
+                raise ValueError('Unsupported transform in {}'.format(tag))
+            continue
+        if tag == 'path':
+            yield parse_path(element.get('d', '')), get_color(
+                    element.get('stroke'))
+        element.clear()
+
+def clip_segment(a, b, low, high):
+    ''' Clip segment from a to b to the box from low to high '''
+    start, end = 0.0, 1.0
+    delta = (b[0] - a[0], b[1] - a[1])
+    for axis in (0, 1):
+        for p, q in ((-delta[axis], a[axis] - low[axis]),
+                (delta[axis], high[axis] - a[axis])):
+            if p == 0:
+                if q < 0:
+                    return None
+            elif p < 0:
+                start = max(start, q / p)
+            else:
+                end = min(end, q / p)
+    if start > end:
+        return None
+    return [(a[0] + start * delta[0], a[1] + start * delta[1]),
+            (a[0] + end * delta[0], a[1] + end * delta[1])]
+
+def clip_polyline(points, low, high):
+    ''' Split points polyline in the parts inside the box from low to high '''
+    parts = []
+    for a, b in zip(points, points[1:]):
+        segment = clip_segment(a, b, low, high)
+        if not segment:
+            continue
+        if parts and parts[-1][-1] == segment[0]:
+            parts[-1].append(segment[1])
+        else:
+            parts.append(segment)
+    return parts
+
+def stitch_svgs(tiles, svg, size):
+    ''' Write to svg (size is width and height in px) the paths of tiles
+        ((svg file, (x, y) offset in px) pairs) cut to their own frame '''
+    ET.register_namespace('', SVG_NS)
+    root = ET.Element('{' + SVG_NS + '}svg', {'version': '1.1',
+        'width': str(size[0]), 'height': str(size[1])})
+    for tile, offset in tiles:
+        tile_root = ET.parse(tile).getroot()
+        tile_size = (get_length(tile_root.get('width')),
+                get_length(tile_root.get('height')))
+        for path in [element for element in tile_root.iter()
+                if local_tag(element) == 'path']:
+            if path.get('transform'):
+                raise ValueError('Unsupported transform in path')
+            d = []
+            for points, closed in parse_path(path.get('d', '')):
+                if closed:
+                    points = points + [points[0]]
+                for part in clip_polyline(points, (0, 0), tile_size):
+                    d.append('M ' + ' L '.join('{:.3f},{:.3f}'.format(
+                        x + offset[0], y + offset[1]) for x, y in part))
+            if d:
+                attribs = dict(path.attrib)
+                attribs['d'] = ' '.join(d)
+                ET.SubElement(root, path.tag, attribs)
+    ET.ElementTree(root).write(svg, encoding='utf-8', xml_declaration=True)
+
+def split_svg(svg, outputs):
+    ''' Write each lineset group of svg to its own file. Outputs maps 
+        lineset names to file paths '''
+    ET.register_namespace('', SVG_NS)
+    ET.register_namespace('inkscape', INKSCAPE_NS)
+    root = ET.parse(svg).getroot()
+    ## Freestyle names groups as <view layer>_<lineset>
+    groups = [group for group in root if local_tag(group) == 'g' and 
+            group.get('{' + INKSCAPE_NS + '}groupmode') == 'lineset']
+    for name, path in outputs.items():
+        lineset_root = ET.Element(root.tag, root.attrib)
+        lineset_root.extend([group for group in groups 
+            if group.get('id').endswith('_' + name)])
+        ET.ElementTree(lineset_root).write(path, encoding='utf-8', 
+                xml_declaration=True)
+
+def new_dxf():
+    ''' Create a dxf document in millimeters '''
+    doc = ezdxf.new('R2010')
+    doc.header['$INSUNITS'] = 4 ## Millimeters
+    return doc
+
+def block_name(name):
+    ''' Get a valid block name from name '''
+    return BLOCK_NAME_RE.sub('_', name)
+
+def get_block(doc, name, layer):
+    ''' Get block name of doc emptied, or create it and insert it on layer '''
+    if name in doc.blocks:
+        block = doc.blocks.get(name)
+        block.delete_all_entities()
+        return block
+    block = doc.blocks.new(name)
+    if layer not in doc.layers:
+        doc.layers.new(layer)
+    doc.modelspace().add_blockref(name, (0, 0), dxfattribs={'layer': layer})
+    return block
+
+def write_blocks(dxf, blocks, copies = {}):
+    ''' Put the modelspace of every file of blocks (block name: (dxf file, 
+        layer)) in a block of dxf inserted once on layer. Copies (block name: 
+        (block name, layer, offset)) get an insert of another block moved by 
+        offset. Blocks already in dxf are replaced. Return the names of the 
+        blocks of dxf '''
+    doc = ezdxf.readfile(dxf) if os.path.exists(dxf) else new_dxf()
+    for name, (path, layer) in blocks.items():
+        source = ezdxf.readfile(path)
+        block = get_block(doc, block_name(name), layer)
+        importer = Importer(source, doc)
+        importer.import_entities(source.modelspace(), block)
+        importer.finalize()
+    for name, (source_name, layer, offset) in copies.items():
+        if block_name(source_name) in doc.blocks:
+            block = get_block(doc, block_name(name), layer)
+            block.add_blockref(block_name(source_name), offset)
+    if blocks or copies:
+        doc.saveas(dxf)
+    return [block.name for block in doc.blocks]
+
+def native_svg2dxf(svg, dxf, scale = 1):
+    ''' Write Freestyle svg paths to dxf as LINE and LWPOLYLINE entities '''
+    paths = get_paths(svg)
+    width, height = next(paths)
+    factor = PX_TO_MM * scale
+    doc = new_dxf()
+    msp = doc.modelspace()
+    for polylines, color in paths:
+        attribs = {'layer': DXF_LAYER, 'linetype': 'ByBlock', 'lineweight': -2}
+        if color == (0, 0, 0):
+            attribs['color'] = DXF_BLACK
+        else:
+            attribs['true_color'] = ezdxf.rgb2int(color)
+        for points, closed in polylines:
+            ## Flip y since svg origin is on top
+            points = [(x * factor, (height - y) * factor) for x, y in points]
+            if len(points) == 2 and not closed:
+                msp.add_line(points[0], points[1], dxfattribs=attribs)
+            else:
+                msp.add_lwpolyline(points, close=closed, dxfattribs=attribs)
+    doc.saveas(dxf)
+
+def external_svg2dxf(svg, dxf, scale = 1):
+    ''' Convert svg to dxf by Inkscape and pstoedit '''
+    eps = os.path.splitext(dxf)[0] + '.eps'
+    eps2dxf = "pstoedit -xscale {} -yscale {} -dt -f ".format(
+        str(scale), str(scale)) + \
+            "'dxf_s:-polyaslines -dumplayernames -mm' {} {}".format(eps, dxf)
+
+    inkscape_shell.export(svg, eps)
+
+    subprocess.run(eps2dxf, shell=True)
+    if os.path.exists(eps):
+        os.remove(eps)
+
+    ## Convert dxf to readable code page (utf-8 -> DWGCODEPAGE ANSI_1252)
+    ## and set linetype and lineweight to 'ByBlock'
+    dxf_stream.rewrite_dxf(dxf)
+
+def svg2dxf(svg, dxf, scale = 1):
+    ''' Convert svg to dxf natively if svg is plain Freestyle output '''
+    try:
+        native_svg2dxf(svg, dxf, scale)
+    except (ValueError, ET.ParseError) as e:
+        print('Convert', svg, 'by Inkscape:', e)
+        external_svg2dxf(svg, dxf, scale)
+
+def convert_svg(svg, scale = 1, oda = None):
+    ''' Convert svg to dxf, and to dwg by oda converter if given, removing 
+        intermediate files. Return output file and (start, end) times of 
+        conversion to dxf and to dwg (None without oda) '''
+    start = time.time()
+    dxf = os.path.splitext(svg)[0] + '.dxf'
+    svg2dxf(svg, dxf, scale)
+    if os.path.exists(svg):
+        os.remove(svg)
+    svg2dxf_times = (start, time.time())
+    if not oda:
+        return dxf, svg2dxf_times, None
+    folder = os.path.dirname(dxf) or '.'
+    subprocess.run([oda, folder, folder, 'ACAD2010', 'DWG', '0', '1', 
+        os.path.basename(dxf)])
+    if os.path.exists(dxf):
+        os.remove(dxf)
+    return os.path.splitext(dxf)[0] + '.dwg', svg2dxf_times, \
+            (svg2dxf_times[1], time.time())
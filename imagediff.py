@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# IMAGE DIFFing
+
+
+# Copyright (c) 2020 Marco Ferrara
+
+# License:
+# GNU GPL License
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Purpose:
+# Rasterize two pdf and write diff.pdf: the first one with parts changed in
+# the second one colorized (yellow for the first, red for the second).
+# Rasters are read once and composed by array operations, a band of rows at
+# a time, and the pdf is written compressing the bands as they come.
+# Usage: imagediff.py A.pdf B.pdf [resolution]
+
+# Dependencies:
+# - pdftoppm (poppler)
+# - numpy
+
+import sys
+import subprocess
+import zlib
+import numpy as np
+
+OUTPUT = 'diff.pdf'
+RESOLUTION = 72
+BAND_ROWS = 256 ## Rows composed at a time
+LUMA = np.array([.2126, .7152, .0722], dtype=np.float32) ## Rec. 709
+WHITE = 255
+
+def to_linear(values):
+    ''' Convert srgb values (0-1) to linear rgb '''
+    return np.where(values <= .04045, values / 12.92, 
+            ((values + .055) / 1.055) ** 2.4).astype(np.float32)
+
+def to_srgb(values):
+    ''' Convert linear rgb values (0-1) to srgb '''
+    return np.where(values <= .0031308, values * 12.92, 
+            1.055 * np.maximum(values, .0031308) ** (1 / 2.4) - .055)
+
+## Images are blended in linear rgb as ImageMagick does with -colorspace RGB:
+## pixels are linearized by a lookup table
+LINEAR = to_linear(np.arange(256) / 255)
+COLOR_A = to_linear(np.array([0xcc, 0x66, 0x00]) / 255) ## Yellow
+COLOR_B = to_linear(np.array([0x80, 0x00, 0x00]) / 255) ## Red
+
+def rasterize(pdf, resolution):
+    ''' Start pdftoppm writing the first page of pdf as ppm to stdout '''
+    return subprocess.Popen(['pdftoppm', '-r', str(resolution), '-f', '1',
+        '-l', '1', pdf], stdout=subprocess.PIPE)
+
+def read_ppm(data):
+    ''' Get the rgb array (rows, columns, 3) of binary ppm data '''
+    tokens = []
+    i = 0
+    while len(tokens) < 4:
+        while data[i:i + 1].isspace():
+            i += 1
+        if data[i:i + 1] == b'#':
+            i = data.index(b'\n', i)
+            continue
+        end = i
+        while not data[end:end + 1].isspace():
+            end += 1
+        tokens.append(data[i:end])
+        i = end
+    if tokens[0] != b'P6' or tokens[3] != b'255':
+        raise ValueError('Not an 8 bit binary ppm')
+    width, height = int(tokens[1]), int(tokens[2])
+    return np.frombuffer(data, dtype=np.uint8, count=width * height * 3,
+            offset=i + 1).reshape(height, width, 3)
+
+def fit(image, shape):
+    ''' Crop image or pad it with white to shape '''
+    if image.shape == shape:
+        return image
+    fitted = np.full(shape, WHITE, dtype=np.uint8)
+    rows, columns = min(shape[0], image.shape[0]), min(shape[1], image.shape[1])
+    fitted[:rows, :columns] = image[:rows, :columns]
+    return fitted
+
+def diff_band(a, b):
+    ''' Compose rgb bands a and b: a with differences colorized and
+        multiplied over a lightened by differences '''
+    a = LINEAR[a]
+    b = LINEAR[b]
+    diff = np.abs(a - b)
+    ## Difference intensity is the opacity of colorized bands
+    mask = (diff @ LUMA)[..., None]
+    colorized_a = ((a @ LUMA)[..., None] + COLOR_A) / 2 * mask
+    colorized_b = ((b @ LUMA)[..., None] + COLOR_B) / 2 * mask
+    ## Multiply colorized bands (premultiplied by mask)
+    colorized = colorized_a * colorized_b + \
+            (colorized_a + colorized_b) * (1 - mask)
+    colorized_alpha = mask * (2 - mask)
+    ## Clean a where it changes and put colorized bands over it
+    cleaned = np.minimum(a + diff, 1)
+    composed = colorized + cleaned * (1 - colorized_alpha)
+    return (to_srgb(composed) * 255 + .5).astype(np.uint8)
+
+def write_pdf(path, bands, width, height, resolution):
+    ''' Write a one page pdf showing the rgb image of width and height pixels
+        given by bands (arrays of rows), sized by resolution '''
+    page_width, page_height = [72 * size / resolution
+            for size in (width, height)]
+    content = 'q {:.3f} 0 0 {:.3f} 0 0 cm /Im0 Do Q'.format(page_width,
+            page_height).encode()
+    offsets = []
+    with open(path, 'wb') as pdf:
+
+        def begin(number):
+            offsets.append(pdf.tell())
+            pdf.write(b'%d 0 obj\n' % number)
+
+        pdf.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        begin(1)
+        pdf.write(b'<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+        begin(2)
+        pdf.write(b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n')
+        begin(3)
+        pdf.write('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {:.3f} {:.3f}]'
+                ' /Resources << /XObject << /Im0 4 0 R >> >> /Contents 5 0 R'
+                ' >>\nendobj\n'.format(page_width, page_height).encode())
+        begin(4)
+        pdf.write(('<< /Type /XObject /Subtype /Image /Width {} /Height {}'
+            ' /ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode'
+            ' /Length 6 0 R >>\nstream\n').format(width, height).encode())
+        start = pdf.tell()
+        compressor = zlib.compressobj(6)
+        for band in bands:
+            pdf.write(compressor.compress(band.tobytes()))
+        pdf.write(compressor.flush())
+        length = pdf.tell() - start
+        pdf.write(b'\nendstream\nendobj\n')
+        begin(5)
+        pdf.write(b'<< /Length %d >>\nstream\n%s\nendstream\nendobj\n' % (
+            len(content), content))
+        begin(6)
+        pdf.write(b'%d\nendobj\n' % length)
+        xref = pdf.tell()
+        pdf.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(offsets) + 1))
+        for offset in offsets:
+            pdf.write(b'%010d 00000 n \n' % offset)
+        pdf.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n'
+                b'%%%%EOF\n' % (len(offsets) + 1, xref))
+
+def imagediff(pdf_a, pdf_b, resolution = RESOLUTION, output = OUTPUT):
+    ''' Write to output the diff of pdf_a and pdf_b rasterized at resolution '''
+    ## Rasterize both at once
+    rasterizers = [rasterize(pdf, resolution) for pdf in (pdf_a, pdf_b)]
+    data = [rasterizer.communicate()[0] for rasterizer in rasterizers]
+    for pdf, rasterizer in zip((pdf_a, pdf_b), rasterizers):
+        if rasterizer.returncode:
+            raise RuntimeError('pdftoppm failed on ' + pdf)
+    a = read_ppm(data[0])
+    b = fit(read_ppm(data[1]), a.shape)
+    height, width = a.shape[:2]
+    bands = (diff_band(a[row:row + BAND_ROWS], b[row:row + BAND_ROWS])
+            for row in range(0, height, BAND_ROWS))
+    write_pdf(output, bands, width, height, float(resolution))
+
+def main():
+    args = sys.argv[1:]
+    if len(args) not in (2, 3):
+        print('Enter two pdf files and the resolution (default 72 dpi)')
+        print('For example: imagediff.py A.pdf B.pdf 200')
+        return
+    imagediff(*args)
+
+if __name__ == '__main__':
+    main()
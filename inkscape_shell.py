@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019 Marco Ferrara
+
+# License:
+# GNU GPL License
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Purpose:
+# Export svg files by long-lived 'inkscape --shell' sessions fed with actions
+# over stdin, instead of starting Inkscape for every file. Sessions crashed or
+# hanging are killed and started again.
+
+# Dependencies:
+# - Inkscape 1.x
+
+import atexit
+import os
+import queue
+import subprocess
+import threading
+import time
+
+INKSCAPE = 'inkscape'
+POOL_SIZE = 1 ## Shells per process: process pools get one shell per worker
+START_TIMEOUT = 60
+EXPORT_TIMEOUT = 120
+RETRIES = 1
+PROMPT = b'>'
+UNGROUP = 'select-all:groups; ' + \
+        'SelectionUnGroup; SelectionUnGroup; SelectionUnGroup; '
+
+class InkscapeShell:
+    ''' A running 'inkscape --shell' process '''
+
+    def __init__(self, inkscape = INKSCAPE):
+        self.process = subprocess.Popen([inkscape, '--shell'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL)
+        self.output = queue.Queue()
+        threading.Thread(target=read_output, args=(self.process,
+            self.output), daemon=True).start()
+        self.wait_prompt(START_TIMEOUT)
+
+    def wait_prompt(self, timeout):
+        ''' Get output until the shell prompt. Raise ChildProcessError if
+            Inkscape exits and TimeoutError if prompt doesn't come in time '''
+        text = b''
+        end = time.time() + timeout
+        while not text.rstrip().endswith(PROMPT):
+            try:
+                chunk = self.output.get(timeout=max(0, end - time.time()))
+            except queue.Empty:
+                raise TimeoutError('Inkscape shell not responding')
+            if chunk is None:
+                raise ChildProcessError('Inkscape shell exited')
+            text += chunk
+        return text.decode(errors='replace')
+
+    def run(self, actions, timeout = EXPORT_TIMEOUT):
+        ''' Run actions (a line of ';' separated actions) and get output '''
+        try:
+            self.process.stdin.write((actions + '\n').encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise ChildProcessError('Inkscape shell exited')
+        return self.wait_prompt(timeout)
+
+    def stop(self):
+        ''' Quit the shell, killing it if still running '''
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+    def kill(self):
+        ''' Kill the shell right away '''
+        self.process.kill()
+        self.process.wait()
+
+class InkscapeShellPool:
+    ''' Shells shared by threads of a process, started when needed '''
+
+    def __init__(self, size = POOL_SIZE, inkscape = INKSCAPE):
+        self.pid = os.getpid()
+        self.inkscape = inkscape
+        self.shells = queue.Queue()
+        for i in range(size):
+            self.shells.put(None)
+        self.started = []
+
+    def run(self, actions, timeout = EXPORT_TIMEOUT):
+        ''' Run actions by a free shell, restarting it if it crashes or
+            hangs and retrying up to RETRIES times '''
+        shell = self.shells.get()
+        try:
+            for attempt in range(RETRIES + 1):
+                try:
+                    if not shell:
+                        shell = InkscapeShell(self.inkscape)
+                        self.started.append(shell)
+                    return shell.run(actions, timeout)
+                except (ChildProcessError, TimeoutError) as e:
+                    print('Restart Inkscape shell:', e)
+                    if shell:
+                        shell.kill()
+                        self.started.remove(shell)
+                    shell = None
+                    if attempt == RETRIES:
+                        raise
+        finally:
+            self.shells.put(shell)
+
+    def close(self):
+        ''' Stop all shells '''
+        for shell in self.started:
+            shell.stop()
+        self.started = []
+
+POOL = None
+
+def read_output(process, output):
+    ''' Put process stdout chunks in output queue, and None at exit '''
+    for chunk in iter(lambda: os.read(process.stdout.fileno(), 4096), b''):
+        output.put(chunk)
+    output.put(None)
+
+def get_pool():
+    ''' Get the shell pool of this process (forked processes get their own) '''
+    global POOL
+    if not POOL or POOL.pid != os.getpid():
+        POOL = InkscapeShellPool()
+    return POOL
+
+def export(svg, output, ungroup = False, area = 'page', 
+        timeout = EXPORT_TIMEOUT):
+    ''' Export svg to output (type by extension), ungrouping everything 
+        first if ungroup. Area is 'page', 'drawing' or None for the default
+        of Inkscape (the drawing for eps) '''
+    if os.path.exists(output):
+        os.remove(output)
+    actions = 'file-open:{}; {}{}export-filename:{}; export-do; file-close'
+    get_pool().run(actions.format(os.path.abspath(svg),
+        UNGROUP if ungroup else '', 
+        'export-area-{}; '.format(area) if area else '',
+        os.path.abspath(output)), timeout)
+    if not os.path.exists(output):
+        raise RuntimeError('Inkscape did not export ' + output)
+
+@atexit.register
+def close():
+    ''' Stop shells of this process at exit '''
+    if POOL and POOL.pid == os.getpid():
+        POOL.close()
@@ -21,8 +21,8 @@
 
 # Dependencies: 
 # - ODAFileConverter
-# - Inkscape
-# - pstoedit
+# - freestyle_svg.py (https://github.com/marzof/scripts)
+# - Inkscape and pstoedit (just for SVG freestyle_svg.py can't convert)
 
 # TODO
 # - add some instructions
@@ -30,18 +30,24 @@
 #   are not included in rendering
 
 import bpy
+import bmesh
 import os, sys
 import re, random
 import collections
+import hashlib, json
+import contextlib
 import subprocess, shlex
+import concurrent.futures, multiprocessing
 from shutil import copyfile
 from pathlib import Path
-import ezdxf
+import numpy as np
 import mathutils
 from mathutils import Vector
-from mathutils import geometry
 from mathutils import Matrix
-from bpy_extras.object_utils import world_to_camera_view
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import freestyle_svg
+import work_queue
 
 import time
 
@@ -55,11 +61,17 @@ norm_path = lambda x: os.path.realpath(x).replace(
 ARGS = [arg for arg in sys.argv[sys.argv.index("--") + 1:]]
 FLAGS = [arg for arg in ARGS if arg.startswith('-')]
 BLANK_CAD = './blank.dwg'
-STATUS = 'status'
+EVENTS = 'events.jsonl'
+MANIFEST = 'manifest.json'
 ODA_FILE_CONVERTER = '/usr/bin/ODAFileConverter'
 LINESTYLE_LAYER_RE = r'.*(_.*)\.dwg'
 FACTOR_MARKER = '-f'
 ADD_SCRIPT_MARKER = '-add'
+SINGLE_RENDER_MARKER = '-single'
+ONE_FILE_MARKER = '-onefile'
+SAME_MARKER = '-same'
+## Instances viewed the same way are copies of a block: output is one file
+ONE_FILE = ONE_FILE_MARKER in FLAGS or SAME_MARKER in FLAGS
 SCRIPT_MODE = 'a' if ADD_SCRIPT_MARKER in FLAGS else 'w'
 SCRIPTS = [{'name': 'xrefs.scr', 'mode': 'a'}, 
         {'name': 'last_xrefs.scr', 'mode': SCRIPT_MODE}]
@@ -67,8 +79,25 @@ FRAME = "{:04d}".format(bpy.context.scene.frame_current)
 RENDER_FACTOR = 2 ## Multiply this value by 1000 to get render resolution
 LARGE_RENDER_FACTOR = int(ARGS[ARGS.index(FACTOR_MARKER) + 1]) \
         if FACTOR_MARKER in ARGS else 1
-RENDERABLE_ARGS = list(set(ARGS) - set(FLAGS) - 
-        set([str(LARGE_RENDER_FACTOR) * (FACTOR_MARKER in ARGS)]))
+JOBS_MARKER = '-j'
+JOBS = int(ARGS[ARGS.index(JOBS_MARKER) + 1]) if JOBS_MARKER in ARGS else 1
+OCCLUSION_MARKER = '-o'
+## Rays per side of the frame of an object to check it is hidden (0 = no 
+## check). Opt-in: objects seen through gaps narrower than the ray spacing 
+## (mullions, railings...) are skipped too
+OCCLUSION_SAMPLES = int(ARGS[ARGS.index(OCCLUSION_MARKER) + 1]) \
+        if OCCLUSION_MARKER in ARGS else 0
+WORKER_ADDRESS = ARGS[ARGS.index(work_queue.WORKER_MARKER) + 1] \
+        if work_queue.WORKER_MARKER in ARGS else None
+MEMORY_MARKER = '-mem'
+## Resident memory (MB) above which remaining cameras are rendered in batches
+MEMORY_BUDGET = float(ARGS[ARGS.index(MEMORY_MARKER) + 1]) \
+        if MEMORY_MARKER in ARGS else None
+PURGE_INTERVAL = 50 ## Objects rendered between purges of orphan data
+VALUED_FLAGS = [FACTOR_MARKER, JOBS_MARKER, OCCLUSION_MARKER, MEMORY_MARKER,
+        work_queue.WORKER_MARKER]
+RENDERABLE_ARGS = list(set(ARGS) - set(FLAGS) - set([ARGS[ARGS.index(flag) + 1]
+    for flag in VALUED_FLAGS if flag in ARGS]))
 DISABLED_OBJS = {obj for obj in bpy.data.objects if obj.hide_render}
 RESOLUTION_RATIO = 254.0/96.0
 BASE_ORTHO_SCALE = RENDER_FACTOR * LARGE_RENDER_FACTOR * RESOLUTION_RATIO
@@ -102,7 +131,26 @@ BOUNDING_BOX_FACES = ((0, 1, 2, 3), (2, 3, 7, 6), (6, 7, 4, 5),
                    (4, 5, 1, 0), (0, 4, 7, 3), (1, 5, 6, 2)) 
 
 FRAME_EDGES = (Vector((0,0)), Vector((1,0)), Vector((1,1)), Vector((0,1)))
+FRAME_CENTER = np.array((0.5, 0.5))
+FRAME_SEGMENTS = np.array([(FRAME_EDGES[i][:], FRAME_EDGES[(i+1)%4][:]) 
+    for i in range(4)])
+## Corners of a box from its (min, max) bounds, in bound_box order
+BOX_CORNERS = ((0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0), 
+        (1, 0, 0), (1, 0, 1), (1, 1, 1), (1, 1, 0))
+GRID_DENSITY = 64 ## Average number of boxes per cell of the scene index
 EXTRUDE_CUT_FACTOR = .005
+CUTTABLES = ['MESH', 'CURVE']
+COLLECTION_INDEXES = {}
+## Svg conversions run while rendering, by a pool created on first use 
+## (workers and coordinators of -j never convert) whose processes just run 
+## freestyle_svg
+CONVERTER = None
+COLLECTION_HASHES = {}
+INSTANCE_POOL_NAME = 'instance_pool'
+## Back views render every object alone: nothing can occlude it
+OCCLUDABLE_STYLES = ['prj']
+OCCLUSION_HITS = 16 ## Max objects crossed by a ray before giving up
+OCCLUSION_EPSILON = 1e-4
 
 print('\n\n\n###################################\n\n\n')
 
@@ -111,6 +159,229 @@ print('script mode', SCRIPT_MODE)
 print('Render factor', LARGE_RENDER_FACTOR)
 print('Renderable styles', RENDERABLE_STYLES)
 
+class EventLog():
+    ''' Timed events of the processing stages of a camera as json lines '''
+    def __init__(self, path, truncate = False):
+        ''' Open log at path for appending (workers log to the same file 
+            of the coordinator), emptying it first if truncate '''
+        self.path = path
+        if truncate:
+            open(path, 'w').close()
+        self.log = open(path, 'ab', buffering=0)
+
+    def write(self, stage, obj = None, ls = None, start = None, end = None, 
+            **data):
+        ''' Write an event of stage from start to end (now by default) '''
+        end = end or time.time()
+        event = {'stage': stage, 'obj': obj, 'ls': ls, 
+                'start': start or end, 'end': end}
+        event.update(data)
+        ## A single unbuffered write per line: appends of processes don't mix
+        self.log.write((json.dumps(event) + '\n').encode())
+
+    @contextlib.contextmanager
+    def stage(self, stage, obj = None, ls = None, **data):
+        ''' Write an event timing the enclosed block: data can be updated 
+            inside it '''
+        start = time.time()
+        yield data
+        self.write(stage, obj, ls, start, **data)
+
+    def summarize(self):
+        ''' Write and return the summary of the events logged so far '''
+        stages = {}
+        objects = {}
+        renders = 0
+        peak_rss = 0
+        start = end = time.time()
+        with open(self.path) as log:
+            for line in log:
+                event = json.loads(line)
+                duration = event['end'] - event['start']
+                start = min(start, event['start'])
+                stage = stages.setdefault(event['stage'], 
+                        {'count': 0, 'time': 0})
+                stage['count'] += 1
+                stage['time'] += duration
+                if event['obj']:
+                    objects[event['obj']] = objects.get(event['obj'], 0) + \
+                            duration
+                renders += event['stage'] == 'render'
+                peak_rss = max(peak_rss, event.get('peak_rss', 0))
+        slowest = sorted(objects.items(), key=lambda x: x[1], reverse=True)
+        summary = {'stages': stages, 'slowest_objects': slowest[:20], 
+                'renders': renders, 'peak_rss': peak_rss, 
+                'renders_per_minute': 60 * renders / max(end - start, 1e-6)}
+        self.write('summary', start=start, **summary)
+        return summary
+
+class CollectionIndex():
+    ''' Objects of an instanced collection with their bounding boxes in 
+        instance space, shared by every instance of the collection '''
+    def __init__(self, collection):
+        self.objects = list(collection.all_objects)
+        self.members = set(self.objects)
+        offset = np.array(Matrix.Translation(-collection.instance_offset))
+        self.boxes = transform_boxes(np.array([offset @ np.array(
+            obj.matrix_world) for obj in self.objects]).reshape(-1, 4, 4), 
+            np.array([obj.bound_box for obj in self.objects]).reshape(-1, 8, 3))
+        bounds = np.stack((self.boxes.reshape(-1, 3).min(axis=0), 
+            self.boxes.reshape(-1, 3).max(axis=0))) if self.objects else None
+        ## Aggregate box of all the objects
+        self.box = bounds[BOX_CORNERS, (0, 1, 2)] if self.objects else None
+
+    def world_boxes(self, container):
+        ''' Get the world space boxes of the objects instanced by container '''
+        matrices = np.repeat(np.array(container.matrix_world)[np.newaxis], 
+                len(self.objects), axis=0)
+        return transform_boxes(matrices, self.boxes)
+
+class InstancePool():
+    ''' Objects made real from collection instances once per run, kept out 
+        of the scene and reused by every render until freed '''
+    def __init__(self):
+        self.collection = None
+        self.objects = {}
+
+    def get(self, obj):
+        ''' Get the real objects of obj instance '''
+        if obj in self.objects:
+            return self.objects[obj]
+        if not self.collection:
+            self.collection = bpy.data.collections.new(INSTANCE_POOL_NAME)
+        ## Making real clears the instance: work on a duplicate
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select_set(True)
+        bpy.context.view_layer.objects.active = obj
+        bpy.ops.object.duplicate(linked=False, mode='TRANSLATION')
+        duplicate = bpy.context.object
+        self.objects[obj] = [ob for ob in make_local(duplicate) 
+                if ob != duplicate]
+        bpy.data.objects.remove(duplicate, do_unlink=True)
+        for ob in self.objects[obj]:
+            for collection in ob.users_collection:
+                collection.objects.unlink(ob)
+            self.collection.objects.link(ob)
+        return self.objects[obj]
+
+    def free(self):
+        ''' Remove real objects, the data made for them and the pool '''
+        objs = [ob for obj in self.objects for ob in self.objects[obj]]
+        datas = {ob.data for ob in objs if ob.data}
+        bpy.data.batch_remove(objs)
+        bpy.data.batch_remove([data for data in datas if not data.users])
+        if self.collection:
+            bpy.data.collections.remove(self.collection)
+        self.collection = None
+        self.objects = {}
+
+INSTANCE_POOL = InstancePool()
+
+class SceneIndex():
+    ''' Uniform grid of the world space bounding boxes of objs, built once 
+        and queried by every camera. Instances are indexed by the aggregate 
+        box of their collection and their objects are tested one by one 
+        only if it is not wholly in or out of frame '''
+    def __init__(self, objs):
+        referenced_objs = get_referenced_objects(objs)
+        self.pairs = [(obj, ref_obj) for ref_obj in referenced_objs 
+                for obj in referenced_objs[ref_obj]]
+        ## Every indexed box covers a range of pairs: an object or an instance
+        self.entries = [ref_obj for ref_obj in referenced_objs 
+                if referenced_objs[ref_obj]]
+        sizes = [len(referenced_objs[ref_obj]) for ref_obj in self.entries]
+        self.ends = np.cumsum([0] + sizes).astype(int)
+        self.starts = self.ends[:-1]
+        self.ends = self.ends[1:]
+        self.is_instance = np.array([ref_obj.type == 'EMPTY' 
+            for ref_obj in self.entries], dtype=bool)
+        self.boxes = np.zeros((len(self.entries), 8, 3))
+        plain = np.flatnonzero(~self.is_instance)
+        self.boxes[plain] = world_boxes([self.pairs[i] 
+            for i in self.starts[plain]])
+        instances = np.flatnonzero(self.is_instance)
+        if len(instances):
+            self.boxes[instances] = transform_boxes(np.array([
+                self.entries[i].matrix_world for i in instances]), 
+                np.array([get_collection_index(
+                    self.entries[i].instance_collection).box 
+                    for i in instances]))
+        self.cells = []
+        self.cell_boxes = np.zeros((0, 8, 3))
+        if self.entries:
+            self.__build_grid()
+
+    def __build_grid(self):
+        ''' Put every box in the cell containing its center and get the cell 
+            bounds as the union of its boxes '''
+        mins = self.boxes.min(axis=1)
+        maxs = self.boxes.max(axis=1)
+        centers = (mins + maxs) / 2
+        low = centers.min(axis=0)
+        size = np.maximum(centers.max(axis=0) - low, 1e-6)
+        divisions = max(1, round((len(self.entries) / GRID_DENSITY) ** (1/3)))
+        cell_coords = np.minimum((divisions * (centers - low) / size).astype(int),
+                divisions - 1)
+        cell_keys = np.ravel_multi_index(cell_coords.T, (divisions,) * 3)
+        keys, cell_of_box = np.unique(cell_keys, return_inverse=True)
+        cell_of_box = cell_of_box.ravel()
+        order = np.argsort(cell_of_box, kind='stable')
+        splits = np.cumsum(np.bincount(cell_of_box, minlength=len(keys)))[:-1]
+        self.cells = np.split(order, splits)
+        cell_mins = np.full((len(keys), 3), np.inf)
+        cell_maxs = np.full((len(keys), 3), -np.inf)
+        np.minimum.at(cell_mins, cell_of_box, mins)
+        np.maximum.at(cell_maxs, cell_of_box, maxs)
+        bounds = np.stack((cell_mins, cell_maxs), axis=1)
+        self.cell_boxes = bounds[:, BOX_CORNERS, (0, 1, 2)]
+        print('Scene index:', len(self.entries), 'boxes in', len(keys), 
+                'cells for', len(self.pairs), 'objects')
+
+    def query(self, cam):
+        ''' Get frame flags of every indexed box, testing just the boxes in 
+            the cells viewed by cam '''
+        flags = {flag: np.zeros(len(self.pairs), dtype=bool) 
+                for flag in ('framed', 'frontal', 'behind')}
+        if not self.entries:
+            return flags
+        viewed_cells = frame_flags(cam, self.cell_boxes)['framed']
+        if cam.data.type != 'ORTHO':
+            ## Projection is not reliable for cells around the camera
+            viewed_cells |= (camera_view(cam, self.cell_boxes)[..., 2] <= 0).any(
+                    axis=1)
+        candidates = [self.cells[i] for i in np.flatnonzero(viewed_cells)]
+        if not candidates:
+            return flags
+        candidates = np.concatenate(candidates)
+        candidate_flags = frame_flags(cam, self.boxes[candidates])
+        plain = ~self.is_instance[candidates]
+        for flag in flags:
+            flags[flag][self.starts[candidates[plain]]] = \
+                    candidate_flags[flag][plain]
+
+        ## Instances wholly in frame and on a side of clip plane get the 
+        ## flags of their aggregate box
+        view = camera_view(cam, self.boxes[candidates])
+        inside = ((view[..., :2] >= 0) & (view[..., :2] <= 1)).all(axis=(1, 2)) \
+                & (view[..., 2] > 0).all(axis=1)
+        all_frontal = (view[..., 2] >= cam.data.clip_start).all(axis=1)
+        all_behind = (view[..., 2] < cam.data.clip_start).all(axis=1)
+        for i in np.flatnonzero(~plain & candidate_flags['framed']):
+            entry = candidates[i]
+            pairs = slice(self.starts[entry], self.ends[entry])
+            if inside[i] and (all_frontal[i] or all_behind[i]):
+                flags['framed'][pairs] = True
+                flags['frontal'][pairs] = all_frontal[i]
+                flags['behind'][pairs] = all_behind[i]
+                continue
+            collection_index = get_collection_index(
+                    self.entries[entry].instance_collection)
+            inner_flags = frame_flags(cam, collection_index.world_boxes(
+                self.entries[entry]))
+            for flag in flags:
+                flags[flag][pairs] = inner_flags[flag]
+        return flags
+
 class Cam():
     def __init__(self, obj, name, folder_path, existing_files, objects):
         self.obj = obj
@@ -119,11 +390,25 @@ class Cam():
         self.scripts = [self.folder_path + os.sep + SCRIPTS[0]['name'], 
                 self.folder_path + os.sep + SCRIPTS[1]['name']]
         self.existing_files = existing_files
+        self.events = EventLog(self.folder_path + os.sep + EVENTS, 
+                truncate=not WORKER_ADDRESS)
         self.objects = objects['all']
         self.frontal_objects = objects['frontal']
         self.behind_objects = objects['behind']
         self.cut_objects = {}
-        self.svgs = []
+        self.cut_meshes = {}
+        self.peak_rss = 0
+        self.tracked = 0
+        self.conversions = {}
+        self.copies = {}
+        self.occluders = None ## Rendered objects, set by first occlusion test
+        self.manifest = load_manifest(self.folder_path + os.sep + MANIFEST)
+        self.render_keys = {}
+        self.object_hashes = {}
+        self.camera_hash = None ## Reset as camera turns for back views
+        self.svgs = {} ## Svg path: (object name, lineset)
+        self.block_file = self.folder_path + os.sep + self.name + '.dxf'
+        self.blocks = []
         self.dxfs = []
         self.dwgs = []
         self.view_frame = [v * Vector((1,1,obj.data.clip_start)) 
@@ -139,158 +424,310 @@ class Cam():
         bpy.context.scene.render.resolution_percentage = render_scale
 
     def create_cut(self):
-        ''' Duplicate, bisect and extrude cut objects '''
-        bpy.ops.object.select_all(action='DESELECT')
+        ''' Create section solids of cut objects '''
+        depsgraph = bpy.context.evaluated_depsgraph_get()
         cut_objs = [ob for ob in self.frontal_objects 
                 if ob in self.behind_objects]
         for ob in cut_objs:
-            ob.select_set(True)
-            bpy.context.view_layer.objects.active = ob
-            print('duplicate', ob.name, 'for cutting object')
-            bpy.ops.object.duplicate(linked=False, mode='TRANSLATION')
-            if ob.type == 'EMPTY' or ob.override_library:
-                contained_objects = make_local(bpy.context.object)
-                cleaned_objects = self.__clean_and_prepare(contained_objects, ob)
-            elif ob.type == 'CURVE':
-                bpy.ops.object.convert(target='MESH')
-                apply_mod(ob, type=['EDGE_SPLIT', 'MIRROR', 'SUBSURF', 'SOLIDIFY', 'BEVEL'])
-            else:
-                apply_mod(ob, type=['EDGE_SPLIT', 'MIRROR', 'SUBSURF', 'SOLIDIFY', 'BEVEL'])
-
-            new_ob = bpy.context.selected_objects
-            self.cut_objects[ob] = new_ob
-            if new_ob:
-                print('Ready to bisect', new_ob, 'of', ob.name)
-                self.__bisect_and_extrude()
-            for sel_ob in new_ob:
-                sel_ob.select_set(False)
-            bpy.ops.object.select_all(action='DESELECT')
-
-    def __clean_and_prepare(self, all_objects, ref_obj):
-        ''' Remove not framed objects, apply modifiers and join the remaining '''
-        to_delete = []
-        to_join = []
-        ## Remove not framed objects from empty
-        for ob in all_objects:
-            framed = in_frame(self.obj, ob, ref_obj)
-            if framed['framed'] and framed['frontal'] and framed['behind']:
-                print('to keep', ob.name)
-                print('prepare to join', ob.name)
-                to_join.append(ob)
-                ## Make single user for multi-user objects
-                if ob.data.users > 1:
-                    ob.data = ob.data.copy()
-                ob.select_set(True)
-                bpy.context.view_layer.objects.active = ob
-                apply_mod(ob, type=['EDGE_SPLIT', 'MIRROR', 'SUBSURF', 'SOLIDIFY', 'BEVEL'])
-            else:
-                print('to delete', ob.name)
-                to_delete.append(ob)
-        bpy.ops.object.select_all(action='DESELECT')
-        for ob in to_delete:
-            ob.select_set(True)
-            bpy.context.view_layer.objects.active = ob
-        bpy.ops.object.delete(use_global=False)
-        bpy.ops.object.select_all(action='DESELECT')
-        for ob in to_join: 
-            print('to join', ob.name)
-            ob.select_set(True)
-            bpy.context.view_layer.objects.active = ob
-            if ob.type == 'CURVE':
-                print('Convert curve to mesh')
-                bpy.ops.object.convert(target='MESH')
-
-        return bpy.context.selected_objects
-
-    def __bisect_and_extrude(self):
-        ''' Enter in edit mode, bisect by cam frame and extrude front and rear '''
-        bpy.ops.object.editmode_toggle()
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, 
-                type='VERT')
-                
-        bpy.ops.mesh.bisect(plane_co=self.frame_loc, plane_no=self.dir,
-            use_fill=True, clear_inner=True, clear_outer=True)
-
-        bpy.ops.mesh.extrude_region_move(
-            MESH_OT_extrude_region={"use_normal_flip":False, "mirror":False},
-            TRANSFORM_OT_translate={"value":self.dir * EXTRUDE_CUT_FACTOR})
-        bpy.ops.mesh.select_all(action='INVERT')
-        bpy.ops.mesh.extrude_region_move(
-            MESH_OT_extrude_region={"use_normal_flip":False, "mirror":False},
-            TRANSFORM_OT_translate={"value":-self.dir * EXTRUDE_CUT_FACTOR})
-
-        bpy.ops.object.editmode_toggle()
+            print('Cut', ob.name)
+            with self.events.stage('cut', ob.name) as event:
+                self.cut_objects[ob] = self.__cut_all(ob, depsgraph)
+                event['cut_objects'] = len(self.cut_objects[ob])
+        self.occluders = None
+
+    def __cut_all(self, ob, depsgraph):
+        ''' Cut ob or the objects it instances '''
+        if ob.type == 'EMPTY':
+            ## Keep just the instanced objects actually cut
+            pairs = [(inner_obj, ob) for inner_obj in 
+                    ob.instance_collection.all_objects 
+                    if inner_obj.type in CUTTABLES]
+            flags = frame_flags(self.obj, world_boxes(pairs))
+            pairs = [pair for i, pair in enumerate(pairs) 
+                    if flags['framed'][i] and flags['frontal'][i] and 
+                    flags['behind'][i]]
+        else:
+            pairs = [(ob, ob)]
+        return list(filter(None, [self.__cut(inner_obj, 
+            box_matrix(inner_obj, container), depsgraph) 
+            for inner_obj, container in pairs]))
+
+    def __cut(self, obj, matrix, depsgraph):
+        ''' Create an object placed by matrix with the section of obj by 
+            cam frame, extruded front and rear '''
+        ## Cut plane and extrusion in obj local space
+        matrix_3x3 = matrix.to_3x3()
+        plane_co = matrix.inverted() @ self.frame_loc
+        plane_no = (matrix_3x3.transposed() @ self.dir).normalized()
+        extrusion = matrix_3x3.inverted() @ (self.dir * EXTRUDE_CUT_FACTOR)
+        ## Evaluated meshes differ from their data just with modifiers
+        mesh_key = obj.name_full if obj.modifiers else obj.data.name_full
+        cut_key = (mesh_key, tuple(round(n, 5) for n in plane_no), 
+                round(plane_no.dot(plane_co), 5),
+                tuple(round(e, 6) for e in extrusion))
+        if cut_key not in self.cut_meshes:
+            self.cut_meshes[cut_key] = get_cut_mesh(obj.evaluated_get(
+                depsgraph), plane_co, plane_no, extrusion)
+        cut_mesh = self.cut_meshes[cut_key]
+        if not cut_mesh:
+            return None
+        cut_obj = bpy.data.objects.new(obj.name + '_cut', cut_mesh)
+        cut_obj.matrix_world = matrix
+        bpy.context.scene.collection.objects.link(cut_obj)
+        return cut_obj
 
     def delete_cut(self):
         ''' Remove created cut object '''
         for ob in self.cut_objects:
-            actual_obj = self.cut_objects[ob]
-            for inner_obj in actual_obj:
-                inner_obj.select_set(True)
-                bpy.context.view_layer.objects.active = inner_obj
-                bpy.data.objects.remove(inner_obj, do_unlink=True) 
+            for cut_obj in self.cut_objects[ob]:
+                bpy.data.objects.remove(cut_obj, do_unlink=True) 
+        self.cut_objects = {}
+        bpy.data.batch_remove([mesh for mesh in self.cut_meshes.values() 
+            if mesh and not mesh.users])
+        self.cut_meshes = {}
+        self.occluders = None
+
+    def track_memory(self):
+        ''' Purge orphan data in memory budget mode (every PURGE_INTERVAL 
+            calls, since it scans all meshes) and record peak RSS '''
+        self.tracked += 1
+        if MEMORY_BUDGET and not self.tracked % PURGE_INTERVAL:
+            purge_orphans()
+        self.peak_rss = max(self.peak_rss, get_rss())
 
     def render(self, tmp_name, fs_linesets, obj):
         ''' Execute render for obj and save it as svg '''
         bpy.context.scene.camera = self.obj
-        actual_obj = [obj]
 
-        for ls in fs_linesets:
+        for ls in self.__get_linesets(fs_linesets, obj):
             print('Start rendering', obj.name, 'with style', ls)
-            status_file = open(self.folder_path + os.sep + STATUS, 'a')
-            status_file.write('\nStart rendering {} with style {}'.format(
-                obj.name, ls))
-            ## Cut render only for actual cut objects
-            if ls == 'cut':
-                if obj in self.cut_objects:
-                    actual_obj = self.cut_objects[obj]
-                else:
-                    return
-            elif obj.type == 'EMPTY':
-                obj.select_set(True)
-                bpy.context.view_layer.objects.active = obj
-                bpy.ops.object.duplicate(linked=False, mode='TRANSLATION')
-                actual_obj = make_local(bpy.context.object)
-
+            render_name = self.__get_render_name(obj, ls)
+            if self.__is_cached(render_name, obj, ls):
+                print('Unchanged:', render_name)
+                self.events.write('cached', obj.name, ls)
+                continue
+            if ls != 'bak' and obj in self.copies:
+                print('Copy of', self.copies[obj][0].name)
+                self.events.write('copy', obj.name, ls)
+                continue
+            if ls in OCCLUDABLE_STYLES and self.__is_occluded(obj):
+                print('Occluded!!')
+                self.events.write('occluded', obj.name, ls)
+                continue
+
+            actual_obj = self.__get_actual_objects(obj, ls)
             for act_ob in actual_obj:
                 bpy.data.collections[tmp_name].objects.link(act_ob)
                 render_condition = act_ob.hide_render
                 act_ob.hide_render = False
 
-            render_name = self.folder_path  + os.sep + ls + os.sep + \
-                    self.name + '-' + undotted(obj.name) + '_' + ls
             print('Render name:', render_name)
             fs_linesets[ls].show_render = True
             bpy.context.scene.render.filepath = render_name
-            bpy.ops.render.render()
-            status_file.write('\n\t...render completed!')
-            status_file.close()
+            with self.events.stage('render', obj.name, ls):
+                bpy.ops.render.render()
             fs_linesets[ls].show_render = False
 
-            self.__handle_svg(render_name)
+            self.__handle_svg(render_name, obj, ls)
         
             for coll_obj in bpy.data.collections[tmp_name].objects:
                 bpy.data.collections[tmp_name].objects.unlink(coll_obj)
                 coll_obj.hide_render = render_condition
 
-    def __handle_svg(self, render_name):
-        ''' Rename and clean up svg '''
-        
-        ## Rename svg to remove frame counting
-        svg = render_name + '.svg'
-        os.rename(render_name + FRAME + '.svg', svg)
-
-        ## Remove svg not containing '<path'
-        svg_content = get_file_content(svg)
-        if '<path' not in svg_content:
-            status_file = open(self.folder_path + os.sep + STATUS, 'a')
-            status_file.write('\n{} not visible'.format(svg))
-            status_file.close()
-            print('Void SVG!!')
-            os.remove(svg)
+    def render_all(self, tmp_name, fs_linesets, objs):
+        ''' Render objs in one Freestyle pass per lineset (using a lineset 
+            per object) and split the svg by object '''
+        bpy.context.scene.camera = self.obj
+        tmp_collection = bpy.data.collections[tmp_name]
+
+        for ls in fs_linesets:
+            print('Start rendering', len(objs), 'objects with style', ls)
+            obj_linesets = {}
+            render_objs = {}
+            render_conditions = {}
+            for obj in [ob for ob in objs 
+                    if ls in self.__get_linesets(fs_linesets, ob)]:
+                render_name = self.__get_render_name(obj, ls)
+                if self.__is_cached(render_name, obj, ls):
+                    self.events.write('cached', obj.name, ls)
+                    continue
+                if ls != 'bak' and obj in self.copies:
+                    self.events.write('copy', obj.name, ls)
+                    continue
+                if ls in OCCLUDABLE_STYLES and self.__is_occluded(obj):
+                    self.events.write('occluded', obj.name, ls)
+                    continue
+                render_objs[render_name] = obj
+                lineset_name = '{}_{}_{}'.format(tmp_name, ls, len(obj_linesets))
+                obj_collection = bpy.data.collections.new(lineset_name)
+                tmp_collection.children.link(obj_collection)
+                for act_ob in self.__get_actual_objects(obj, ls):
+                    obj_collection.objects.link(act_ob)
+                    render_conditions.setdefault(act_ob, act_ob.hide_render)
+                    act_ob.hide_render = False
+                obj_linesets[render_name] = new_lineset(lineset_name, ls, 
+                        obj_collection, fs_linesets[ls].linestyle)
+                obj_linesets[render_name].show_render = True
+
+            if obj_linesets:
+                render_name = self.folder_path + os.sep + ls + os.sep + \
+                        self.name + '_' + ls
+                print('Render name:', render_name)
+                bpy.context.scene.render.filepath = render_name
+                with self.events.stage('render', ls=ls, 
+                        objects=len(obj_linesets)):
+                    bpy.ops.render.render()
+                with self.events.stage('split', ls=ls):
+                    freestyle_svg.split_svg(render_name + FRAME + '.svg', 
+                            {obj_linesets[name].name: name + FRAME + '.svg' 
+                                for name in obj_linesets})
+                os.remove(render_name + FRAME + '.svg')
+
+            for name in obj_linesets:
+                self.__handle_svg(name, render_objs[name], ls)
+                obj_collection = obj_linesets[name].collection
+                FREESTYLE_SETTINGS.linesets.remove(obj_linesets[name])
+                bpy.data.collections.remove(obj_collection)
+            for act_ob in render_conditions:
+                act_ob.hide_render = render_conditions[act_ob]
+
+    def __get_linesets(self, fs_linesets, obj):
+        ''' Get linesets to render obj with '''
+        linesets = []
+        for ls in fs_linesets:
+            ## Cut render only for actual cut objects
+            if ls == 'cut' and obj not in self.cut_objects:
+                break
+            linesets.append(ls)
+        return linesets
+
+    def __get_render_name(self, obj, ls):
+        ''' Get path (without extension) of the render of obj with ls '''
+        return self.folder_path  + os.sep + ls + os.sep + \
+                self.name + '-' + undotted(obj.name) + '_' + ls
+
+    def __get_actual_objects(self, obj, ls):
+        ''' Get the objects to actually render for obj with ls '''
+        if ls == 'cut':
+            return self.cut_objects[obj]
+        if obj.type == 'EMPTY':
+            return INSTANCE_POOL.get(obj)
+        return [obj]
+
+    def __is_cached(self, render_name, obj, ls):
+        ''' Check if render of obj with ls is unchanged since last run and 
+            its dwg is still there '''
+        ## Other objects occluding obj are not part of the key. Hashes are
+        ## computed once for every lineset
+        if obj not in self.object_hashes:
+            self.object_hashes[obj] = object_hash(obj)
+        if not self.camera_hash:
+            self.camera_hash = camera_hash(self.obj)
+        render_key = hashlib.sha1('{}{}{}'.format(self.object_hashes[obj], 
+            self.camera_hash, lineset_hash(ls)).encode()).hexdigest()
+        rel_render_name = os.path.relpath(render_name, self.folder_path)
+        self.render_keys[rel_render_name] = render_key
+        if ONE_FILE:
+            return self.manifest.get(rel_render_name) == render_key and \
+                    os.path.exists(self.block_file)
+        return self.manifest.get(rel_render_name) == render_key and \
+                os.path.exists(render_name + '.dwg')
+
+    def __is_occluded(self, obj):
+        ''' Check if obj is certainly hidden by other objects '''
+        if not OCCLUSION_SAMPLES:
+            return False
+        if obj.type == 'EMPTY':
+            pairs = [(inner_obj, obj) for inner_obj in 
+                    obj.instance_collection.all_objects 
+                    if inner_obj.type in CUTTABLES]
         else:
-            self.svgs.append(svg)
+            pairs = [(obj, obj)]
+        ## Hits on obj, its instanced objects or its cut make it visible
+        members = {inner_obj for inner_obj, container in pairs} | {obj} | \
+                set(self.cut_objects.get(obj, []))
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        if self.occluders is None:
+            self.occluders = get_rendered_objects(depsgraph)
+        return occluded(self.obj, pairs, members, depsgraph, self.occluders)
+
+    def __handle_svg(self, render_name, obj, ls):
+        ''' Rename and clean up svg '''
+        with self.events.stage('svg', obj.name, ls) as event:
+            ## Rename svg to remove frame counting
+            svg = render_name + '.svg'
+            os.rename(render_name + FRAME + '.svg', svg)
+
+            ## Remove svg not containing '<path'
+            svg_content = get_file_content(svg)
+            event['void'] = '<path' not in svg_content
+            if event['void']:
+                print('Void SVG!!')
+                os.remove(svg)
+            else:
+                self.svgs[svg] = (obj.name, ls)
+                ## Coordinator converts svgs of workers
+                if not WORKER_ADDRESS:
+                    self.__convert(svg)
+
+    def __convert(self, svg):
+        ''' Start conversion of svg to dxf: finalize() converts dxfs to dwg '''
+        if svg not in self.conversions:
+            self.conversions[svg] = get_converter().submit(
+                    freestyle_svg.convert_svg, svg, LARGE_RENDER_FACTOR)
+
+    def find_copies(self, scene_index):
+        ''' Map instances viewed exactly like another one (same geometry, 
+            same rotation and scale to camera, same cut, wholly framed and 
+            with no object of scene_index possibly covering them) to that 
+            one and the offset (mm) of their drawings '''
+        if self.obj.data.type != 'ORTHO':
+            return
+        entries = {obj: i for i, obj in enumerate(scene_index.entries)}
+        instances = [obj for obj in self.frontal_objects if obj.type == 'EMPTY' 
+                and obj in entries and obj not in DISABLED_OBJS]
+        if len(instances) < 2:
+            return
+        view = camera_view(self.obj, scene_index.boxes)
+        low, high = view.min(axis=1), view.max(axis=1)
+        ## Objects wholly in front of clip plane are not rendered
+        low[high[:, 2] < self.obj.data.clip_start] = np.inf
+        indices = np.array([entries[obj] for obj in instances])
+        inside = ((low[indices, :2] >= 0) & (high[indices, :2] <= 1)).all(axis=1)
+        covered = (low[np.newaxis, :, :2] < high[indices, np.newaxis, :2]).all(
+                axis=2) & (high[np.newaxis, :, :2] > low[indices, np.newaxis, 
+                    :2]).all(axis=2) & (low[np.newaxis, :, 2] < 
+                            high[indices, np.newaxis, 2])
+        covered[np.arange(len(indices)), indices] = False
+
+        matrix = self.obj.matrix_world.normalized()
+        rotation = matrix.to_3x3().inverted()
+        forward = matrix.to_3x3() @ Vector((0, 0, -1))
+        classes = {}
+        for i, obj in enumerate(instances):
+            if not inside[i] or covered[i].any():
+                continue
+            depth = None
+            if obj in self.behind_objects:
+                depth = round((obj.matrix_world.translation - 
+                    matrix.translation).dot(forward), 5)
+            key = (collection_hash(obj.instance_collection), tuple(round(v, 5) 
+                for row in rotation @ obj.matrix_world.to_3x3() for v in row), 
+                depth)
+            classes.setdefault(key, []).append(obj)
+
+        ## Drawing millimeters per scene unit
+        render = bpy.context.scene.render
+        scale = render.resolution_x * round(100 * self.obj.data.ortho_scale / 
+                BASE_ORTHO_SCALE) / 100 * freestyle_svg.PX_TO_MM * \
+                LARGE_RENDER_FACTOR / self.obj.data.ortho_scale
+        for objs in classes.values():
+            objs.sort(key=lambda ob: ob.name)
+            for obj in objs[1:]:
+                offset = rotation @ (obj.matrix_world.translation - 
+                        objs[0].matrix_world.translation)
+                self.copies[obj] = (objs[0], (offset.x * scale, offset.y * scale))
+        print('Copies of other instances:', len(self.copies))
 
     def set_back(self):
         ''' Invert cam direction to render back view '''
@@ -301,24 +738,80 @@ class Cam():
         bpy.ops.transform.resize(value=(1,1,-1), orient_type='LOCAL')
         bpy.ops.transform.translate(value=(0,0,2*self.obj.data.clip_start), 
                 orient_type='LOCAL')
+        self.camera_hash = None
 
     def finalize(self):    
-        ''' Convert svg to dwg and write script to embed xref to dwg'''
-        self.dxfs = list(filter(None, 
-            [svg2dxf(svg_f) for svg_f in self.svgs]))
-        subprocess.run([ODA_FILE_CONVERTER, self.folder_path, self.folder_path, 
-            'ACAD2010', 'DWG', '1', '1', '*.dxf'])
+        ''' Wait for svg conversions and write script to embed xref to dwg'''
+        for svg_f in self.svgs:
+            self.__convert(svg_f)
+        for svg_f in self.svgs:
+            obj_name, ls = self.svgs[svg_f]
+            try:
+                dxf, svg2dxf_times, oda_times = \
+                        self.conversions[svg_f].result()
+            except Exception as e:
+                print('Conversion of', svg_f, 'failed:', e)
+                continue
+            self.events.write('svg2dxf', obj_name, ls, *svg2dxf_times, 
+                    file=svg_f)
+            self.dxfs.append(dxf)
+        if ONE_FILE:
+            self.__write_blocks()
+        elif self.dxfs:
+            ## A single run for every dxf in the camera folders
+            with self.events.stage('oda', files=len(self.dxfs)):
+                subprocess.run([ODA_FILE_CONVERTER, self.folder_path, 
+                    self.folder_path, 'ACAD2010', 'DWG', '1', '1', '*.dxf'])
+            dwgs = [re.sub('\.dxf$', '.dwg', dxf) for dxf in self.dxfs]
+            self.dwgs = [dwg for dwg in dwgs if os.path.exists(dwg)]
         for d in self.dxfs:
             if os.path.exists(d):
                 os.remove(d)
-        self.dwgs = [re.sub('\.dxf$', '.dwg', dxf) for dxf in self.dxfs]
         
         print('dwgs:', self.dwgs)
         #print('existing files:', self.existing_files)
         new_objs = list(set(self.dwgs) - set(self.existing_files))
         print('\n\nnew files:', new_objs)
         if new_objs:
-            self.__create_cad_script(new_objs)
+            with self.events.stage('script', files=len(new_objs)):
+                self.__create_cad_script(new_objs)
+        self.__update_manifest()
+
+    def __write_blocks(self):
+        ''' Put every dxf in a block of the camera dxf and convert it to dwg '''
+        copies = {os.path.basename(self.__get_render_name(obj, ls)): (
+            os.path.basename(self.__get_render_name(self.copies[obj][0], ls)), 
+            '_' + ls, self.copies[obj][1]) for obj in self.copies 
+            for ls in RENDERABLE_STYLES if ls != 'bak'}
+        with self.events.stage('blocks', files=len(self.dxfs)):
+            self.blocks = freestyle_svg.write_blocks(self.block_file, 
+                    {Path(dxf).stem: (dxf, re.search(LINESTYLE_LAYER_RE, 
+                        re.sub('\.dxf$', '.dwg', dxf)).group(1)) 
+                        for dxf in self.dxfs}, copies)
+        if self.dxfs:
+            with self.events.stage('oda', files=1):
+                subprocess.run([ODA_FILE_CONVERTER, self.folder_path, 
+                    self.folder_path, 'ACAD2010', 'DWG', '0', '1', 
+                    os.path.basename(self.block_file)])
+        self.dwgs = [re.sub('\.dxf$', '.dwg', self.block_file)]
+
+    def __has_output(self, rel_render_name):
+        ''' Check if the render is in the dwgs of the camera '''
+        if ONE_FILE:
+            return freestyle_svg.block_name(os.path.basename(
+                rel_render_name)) in self.blocks
+        return os.path.exists(self.folder_path + os.sep + rel_render_name + 
+                '.dwg')
+
+    def __update_manifest(self):
+        ''' Store render keys of existing dwgs for next runs '''
+        for rel_render_name, render_key in self.render_keys.items():
+            if self.__has_output(rel_render_name):
+                self.manifest[rel_render_name] = render_key
+            else:
+                self.manifest.pop(rel_render_name, None)
+        with open(self.folder_path + os.sep + MANIFEST, 'w') as manifest:
+            json.dump(self.manifest, manifest, indent=1, sort_keys=True)
 
     def __create_cad_script(self, new_objs):
         ''' Create script to run on cad file '''
@@ -331,7 +824,10 @@ class Cam():
         ''' Write script for embedding xref in the right layers '''
         for new_obj in new_objs:
             rel_obj = new_obj.replace(RENDER_PATH,'').strip(os.sep)
-            layer_name = re.search(LINESTYLE_LAYER_RE, rel_obj).group(1)
+            ## Camera dwg of blocks has layers inside
+            layer_match = re.search(LINESTYLE_LAYER_RE, rel_obj)
+            layer_name = layer_match.group(1) if layer_match and \
+                    not ONE_FILE else '0'
             scr.write('LAYER\nM\n{}\n\nXREF\na\n{}\n0,0,0\n1\n1\n0\n'.format(
                 layer_name, rel_obj))
         scr.write('LAYER\nM\n0\n\n')
@@ -345,51 +841,129 @@ def get_file_content(f):
     f.close()
     return f_content
 
-def svg2dxf(svg):
-    ''' Convert svg to dxf '''
-    render_path = os.path.splitext(svg)[0]
-    eps = render_path + '.eps'
-    dxf = render_path + '.dxf'
-
-    eps2dxf = "pstoedit -xscale {} -yscale {} -dt -f ".format(
-        str(LARGE_RENDER_FACTOR), str(LARGE_RENDER_FACTOR)) + \
-            "'dxf_s:-polyaslines -dumplayernames -mm' {} {}".format(eps, dxf)
-
-    ## Run with Inkscape 0.92
-    #subprocess.run(['inkscape', '-f', svg, '-C', '-E', eps])
-    ## Run with Inkscape 1.0
-    subprocess.run(['inkscape', svg, '-C', '-o', eps])
-
-    if os.path.exists(svg):
-        os.remove(svg)
-
-    subprocess.run(eps2dxf, shell=True) 
-    if os.path.exists(eps):
-        os.remove(eps)
-
-    ## Convert dxf to readable code page (utf-8 -> DWGCODEPAGE ANSI_1252)
-    ## and set linetype and lineweight to 'ByBlock'
-    dxf_file = ezdxf.readfile(dxf, 'utf-8')
-    for entity in dxf_file.modelspace().query('LINE'):
-        entity.dxf.linetype = 'ByBlock'
-        entity.dxf.lineweight = -2
-    dxf_file.saveas(dxf)
-
-    return dxf
-
-def apply_mod(obj, type = []):
-    ''' Apply modifier of type "type" '''
-
-    ## Remove shape keys
-    ## TODO apply the active shape key after the other to keep the shape
-    if obj.data.shape_keys:
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.shape_key_remove(all=True)
-        print('remove shape_key', obj.data.shape_keys)
-
-    mods = [mod for mod in obj.modifiers if mod.type in type and mod.show_render]
-    for mod in mods:
-        bpy.ops.object.modifier_apply(modifier=mod.name)
+def load_manifest(manifest_path):
+    ''' Get render keys stored by previous runs '''
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as manifest:
+        return json.load(manifest)
+
+def get_converter():
+    ''' Get the pool converting svgs, creating it on first use '''
+    global CONVERTER
+    if not CONVERTER:
+        CONVERTER = concurrent.futures.ProcessPoolExecutor(
+                max(1, (os.cpu_count() or 2) - 1), 
+                mp_context=multiprocessing.get_context('fork'))
+    return CONVERTER
+
+def get_rss():
+    ''' Get resident memory of this process in MB (0 if unknown) '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0
+
+def purge_orphans():
+    ''' Remove meshes and curves no more used by any object '''
+    for datas in (bpy.data.meshes, bpy.data.curves):
+        bpy.data.batch_remove([data for data in datas 
+            if not data.users and not data.use_fake_user])
+
+def hash_values(hash_obj, values):
+    ''' Update hash_obj with values rounded to skip float noise '''
+    hash_obj.update(np.round(np.array(values, dtype=np.float64), 6).tobytes())
+
+def hash_mesh(hash_obj, obj):
+    ''' Update hash_obj with evaluated mesh data of obj '''
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh()
+    if mesh is None:
+        return
+    data = {'co': (mesh.vertices, 3, np.float32), 
+            'vertices': (mesh.edges, 2, np.int32), 
+            'use_freestyle_mark': (mesh.edges, 1, bool), 
+            'vertex_index': (mesh.loops, 1, np.int32), 
+            'loop_total': (mesh.polygons, 1, np.int32)}
+    for attr, (items, size, dtype) in data.items():
+        values = np.empty(len(items) * size, dtype=dtype)
+        items.foreach_get(attr, values)
+        hash_values(hash_obj, values)
+    obj_eval.to_mesh_clear()
+
+def object_hash(obj):
+    ''' Hash geometry and placement of obj (and of its instanced objects) '''
+    hash_obj = hashlib.sha1()
+    hash_values(hash_obj, obj.matrix_world)
+    if obj.type == 'EMPTY' and obj.instance_collection:
+        hash_obj.update(collection_hash(obj.instance_collection).encode())
+    elif obj.type in RENDERABLES and obj.type != 'EMPTY':
+        hash_mesh(hash_obj, obj)
+    return hash_obj.hexdigest()
+
+def collection_hash(collection):
+    ''' Hash geometry and placement of the objects of collection (cached) '''
+    if collection in COLLECTION_HASHES:
+        return COLLECTION_HASHES[collection]
+    hash_obj = hashlib.sha1()
+    hash_values(hash_obj, collection.instance_offset)
+    for inner_obj in sorted(collection.all_objects, key=lambda ob: ob.name):
+        hash_obj.update(inner_obj.name.encode())
+        hash_values(hash_obj, inner_obj.matrix_world)
+        if inner_obj.type in RENDERABLES and inner_obj.type != 'EMPTY':
+            hash_mesh(hash_obj, inner_obj)
+    COLLECTION_HASHES[collection] = hash_obj.hexdigest()
+    return COLLECTION_HASHES[collection]
+
+def camera_hash(cam):
+    ''' Hash camera parameters affecting renders '''
+    render = bpy.context.scene.render
+    hash_obj = hashlib.sha1((cam.data.type + cam.data.sensor_fit).encode())
+    hash_values(hash_obj, cam.matrix_world)
+    hash_values(hash_obj, [cam.data.ortho_scale, cam.data.clip_start, 
+        cam.data.shift_x, cam.data.shift_y, cam.data.lens, 
+        cam.data.sensor_width, cam.data.sensor_height, 
+        render.resolution_x, render.resolution_y, 
+        render.resolution_percentage, render.pixel_aspect_x, 
+        render.pixel_aspect_y, LARGE_RENDER_FACTOR, 
+        FREESTYLE_SETTINGS.crease_angle, FREESTYLE_SETTINGS.use_smoothness])
+    return hash_obj.hexdigest()
+
+def lineset_hash(ls):
+    ''' Hash lineset definition '''
+    return hashlib.sha1(json.dumps(FREESTYLE_SETS[ls], 
+        sort_keys=True).encode()).hexdigest()
+
+def get_cut_mesh(obj_eval, plane_co, plane_no, extrusion):
+    ''' Bisect evaluated obj by plane, fill the section and extrude it front 
+        (closed) and rear (open): plane and extrusion are in local space '''
+    mesh = bpy.data.meshes.new_from_object(obj_eval)
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bpy.data.meshes.remove(mesh)
+    cut = bmesh.ops.bisect_plane(bm, geom=bm.verts[:] + bm.edges[:] + 
+            bm.faces[:], plane_co=plane_co, plane_no=plane_no, 
+            clear_inner=True, clear_outer=True)
+    cut_edges = [e for e in cut['geom_cut'] if isinstance(e, bmesh.types.BMEdge)]
+    if not cut_edges:
+        bm.free()
+        return None
+    bmesh.ops.triangle_fill(bm, use_beauty=True, use_dissolve=True, 
+            edges=cut_edges, normal=plane_no)
+    bmesh.ops.translate(bm, verts=bm.verts[:], vec=extrusion)
+    rear_edges = [e for e in bm.edges if e.is_boundary or e.is_wire]
+    rear = bmesh.ops.extrude_edge_only(bm, edges=rear_edges)
+    bmesh.ops.translate(bm, verts=[v for v in rear['geom'] 
+        if isinstance(v, bmesh.types.BMVert)], vec=-2 * extrusion)
+    cut_mesh = bpy.data.meshes.new(obj_eval.name + '_cut')
+    bm.to_mesh(cut_mesh)
+    bm.free()
+    return cut_mesh
 
 def make_local(obj):
     ''' Convert linked object to local object '''
@@ -407,81 +981,184 @@ def make_local(obj):
         bpy.ops.object.make_local(type='SELECT_OBDATA')
     return all_objects
 
-def in_frame(cam, obj, container):
-    ''' Filter objs and return just those viewed from cam '''
-    #print('Check visibility for', obj.name)
-    linked = False
-    if container.instance_collection:
-        for inner_obj in container.instance_collection.all_objects:
-            if obj == inner_obj:
-                linked = True
-                break
-    if linked:
-        print(obj.name, 'is linked')
-        matrix = container.matrix_world
-        #print('matrix', matrix)
-        #print('obj matrix', obj.matrix_world)
+def get_collection_index(collection):
+    ''' Get the (cached) index of collection '''
+    if collection not in COLLECTION_INDEXES:
+        COLLECTION_INDEXES[collection] = CollectionIndex(collection)
+    return COLLECTION_INDEXES[collection]
+
+def box_matrix(obj, container):
+    ''' Get the matrix bringing obj bounding box to world space '''
+    if container.instance_collection and obj in get_collection_index(
+            container.instance_collection).members:
         ref_offset = container.instance_collection.instance_offset
+        return container.matrix_world @ Matrix.Translation(-ref_offset) @ \
+                obj.matrix_world
+    return obj.matrix_world
+
+def world_boxes(pairs):
+    ''' Pack bounding boxes of (obj, container) pairs in a (N, 8, 3) array '''
+    if not pairs:
+        return np.zeros((0, 8, 3))
+    matrices = np.array([box_matrix(obj, container) for obj, container in pairs])
+    corners = np.array([obj.bound_box for obj, container in pairs])
+    return transform_boxes(matrices, corners)
+
+def transform_boxes(matrices, boxes):
+    ''' Apply (N, 4, 4) matrices to (N, 8, 3) boxes '''
+    return np.einsum('nij,nkj->nki', matrices[:, :3, :3], boxes) + \
+            matrices[:, np.newaxis, :3, 3]
+
+def camera_view(cam, coords):
+    ''' Vectorized world_to_camera_view for a (..., 3) array of coords '''
+    matrix = np.array(cam.matrix_world.normalized().inverted())
+    local = coords @ matrix[:3, :3].T + matrix[:3, 3]
+    z = -local[..., 2]
+    frame = cam.data.view_frame(scene=bpy.context.scene)
+    min_x, max_x = frame[2].x, frame[1].x
+    min_y, max_y = frame[1].y, frame[0].y
+    if cam.data.type == 'ORTHO':
+        x = (local[..., 0] - min_x) / (max_x - min_x)
+        y = (local[..., 1] - min_y) / (max_y - min_y)
     else:
-        matrix = Matrix((
-            (1.0, 0.0, 0.0, 0.0),
-            (0.0, 1.0, 0.0, 0.0),
-            (0.0, 0.0, 1.0, 0.0),
-            (0.0, 0.0, 0.0, 1.0)))
-        ref_offset = Vector((0.0, 0.0, 0.0))
-    box = [matrix @ ((obj.matrix_world @ Vector(v)) - ref_offset) 
-            for v in obj.bound_box]
-    #print('ref_offset', ref_offset)
-    #print('box', box)
-
-    frontal = False
-    behind = False
-    framed = False
-
-    bound_box_verts_from_cam = []
+        ## Frame scales with distance from the camera
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = z / -frame[0].z
+            x = (local[..., 0] - min_x * scale) / ((max_x - min_x) * scale)
+            y = (local[..., 1] - min_y * scale) / ((max_y - min_y) * scale)
+        x[z == 0] = 0.5
+        y[z == 0] = 0.5
+    return np.stack((x, y, z), axis=-1)
+
+def cross_2d(a, b):
+    ''' Z component of cross product of (..., 2) arrays '''
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+def quads_contain(quads, point):
+    ''' Check if point is inside any of the (N, F, 4, 2) quads '''
+    sides = cross_2d(np.roll(quads, -1, axis=-2) - quads, point - quads)
+    inside = (sides >= 0).all(axis=-1) | (sides <= 0).all(axis=-1)
+    return inside.any(axis=-1)
+
+def segments_cross(segments, others):
+    ''' Check if any of the (N, E, 2, 2) segments crosses any of the 
+        (S, 2, 2) others '''
+    a = segments[..., np.newaxis, 0, :]
+    da = segments[..., np.newaxis, 1, :] - a
+    b = others[:, 0]
+    db = others[:, 1] - b
+    denom = cross_2d(da, db)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = cross_2d(b - a, db) / denom
+        u = cross_2d(b - a, da) / denom
+    cross = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    return cross.any(axis=(-2, -1))
+
+def frame_flags(cam, boxes):
+    ''' Get framed, frontal and behind flags for every box in the
+        (N, 8, 3) array of world space bounding boxes '''
+    view = camera_view(cam, boxes)
+    x, y, z = view[..., 0], view[..., 1], view[..., 2]
     ## If a vertex of bounding box is in camera_view then object is in
-    for v in box:
-        x, y, z = world_to_camera_view(bpy.context.scene, cam, v)
-        bound_box_verts_from_cam.append((x, y, z))
-        if z >= cam.data.clip_start:
-            frontal = True
-        else:
-            behind = True
-        if 1 >= x >= 0 and 1 >= y >= 0:
-            #print(obj.name, "is FRAMED! (in vertex", v, ")")
-            framed = True
-
-    if not framed:
-        ## Check if obect is bigger than frame
-        for face in BOUNDING_BOX_FACES:
-            face_verts = [bound_box_verts_from_cam[v] for v in face]
-            intersect = mathutils.geometry.intersect_point_quad_2d(
-                    Vector((0.5, 0.5, 0.0)), 
-                    face_verts[0], face_verts[1], face_verts[2], face_verts[3])
-            if intersect:
-                framed = True
-                break
+    framed = ((x >= 0) & (x <= 1) & (y >= 0) & (y <= 1)).any(axis=1)
+    frontal = (z >= cam.data.clip_start).any(axis=1)
+    behind = (z < cam.data.clip_start).any(axis=1)
 
-    if framed:
-        return {'framed': framed, 'frontal': frontal, 'behind': behind}
+    ## Check if object is bigger than frame
+    unframed = ~framed
+    if unframed.any():
+        faces = view[unframed][:, BOUNDING_BOX_FACES, :2]
+        framed[unframed] = quads_contain(faces, FRAME_CENTER)
 
     ## If an edge intersects camera frame then obj is in
-    for e in BOUNDING_BOX_EDGES:
-        box_edge = [Vector(world_to_camera_view(bpy.context.scene, cam, box[e[0]])[:2]),
-            Vector(world_to_camera_view(bpy.context.scene, cam, box[e[1]])[:2])]
-        for i in range(4):
-            intersect = geometry.intersect_line_line_2d(
-                box_edge[0], box_edge[1], FRAME_EDGES[i], FRAME_EDGES[(i+1)%4])
-            #print('intersect in', intersect)
-            if intersect:
-                #print(obj.name, "is FRAMED! (intersects in", intersect, ")")
-                framed = True
-                return {'framed': framed, 'frontal': frontal, 'behind': behind}
-
-    #print(obj.name, "is NOT FRAMED!")
-    frontal = False
-    behind = False
-    return {'framed': framed, 'frontal': frontal, 'behind': behind}
+    unframed = ~framed
+    if unframed.any():
+        edges = view[unframed][:, BOUNDING_BOX_EDGES, :2]
+        framed[unframed] = segments_cross(edges, FRAME_SEGMENTS)
+
+    return {'framed': framed, 'frontal': frontal & framed, 
+            'behind': behind & framed}
+
+def ray_occluded(depsgraph, start, direction, forward, near, far, members, 
+        occluders):
+    ''' Check if the ray from start (at depth 0 along forward) first hits 
+        an object of occluders not in members between near and far depths '''
+    origin = start
+    for i in range(OCCLUSION_HITS):
+        hit, location, normal, index, obj, matrix = \
+                bpy.context.scene.ray_cast(depsgraph, origin, direction)
+        if not hit:
+            return False
+        depth = (location - start).dot(forward)
+        if depth >= far or obj.original in members:
+            return False
+        if depth > near and obj.original in occluders:
+            return True
+        origin = location + direction * OCCLUSION_EPSILON
+    return False
+
+def occluded(cam, pairs, members, depsgraph, occluders):
+    ''' Check if a grid of OCCLUSION_SAMPLES rays over the frame of the 
+        boxes of (obj, container) pairs is all stopped in front of them by
+        objects of occluders '''
+    view = camera_view(cam, world_boxes(pairs)).reshape(-1, 3)
+    ## Objects crossing clip plane (or camera plane) are never hidden
+    if not len(view) or view[:, 2].min() <= cam.data.clip_start:
+        return False
+    low = np.clip(view[:, :2].min(axis=0), 0, 1)
+    high = np.clip(view[:, :2].max(axis=0), 0, 1)
+    matrix = cam.matrix_world.normalized()
+    forward = (matrix.to_3x3() @ Vector((0, 0, -1))).normalized()
+    frame = cam.data.view_frame(scene=bpy.context.scene)
+    min_x, max_x = frame[2].x, frame[1].x
+    min_y, max_y = frame[1].y, frame[0].y
+    for x in np.linspace(low[0], high[0], OCCLUSION_SAMPLES):
+        for y in np.linspace(low[1], high[1], OCCLUSION_SAMPLES):
+            point = Vector((min_x + x * (max_x - min_x), 
+                min_y + y * (max_y - min_y), frame[0].z))
+            if cam.data.type == 'ORTHO':
+                start = matrix @ Vector((point.x, point.y, 0))
+                direction = forward
+            else:
+                start = matrix.translation
+                direction = (matrix.to_3x3() @ point).normalized()
+            if not ray_occluded(depsgraph, start, direction, forward, 
+                    cam.data.clip_start, view[:, 2].min(), members, 
+                    occluders):
+                return False
+    return True
+
+def get_render_collections(collection):
+    ''' Get collection and its descendants not disabled in renders '''
+    if collection.hide_render:
+        return set()
+    collections = {collection}
+    for child in collection.children:
+        collections |= get_render_collections(child)
+    return collections
+
+def get_rendered_objects(depsgraph):
+    ''' Get original objects actually rendered: instanced objects only if 
+        every object instancing them is rendered (ray casts don't tell 
+        which instance they hit) '''
+    collections = get_render_collections(bpy.context.scene.collection)
+    is_rendered = lambda obj: not obj.hide_render and \
+            any(coll in collections for coll in obj.users_collection)
+    rendered = set()
+    hidden = set()
+    for instance in depsgraph.object_instances:
+        obj = instance.object.original
+        if instance.is_instance and (obj.hide_render or 
+                not is_rendered(instance.parent.original)):
+            hidden.add(obj)
+        elif instance.is_instance or is_rendered(obj):
+            rendered.add(obj)
+    return rendered - hidden
+
+def in_frame(cam, obj, container):
+    ''' Check if obj (contained in container) is viewed from cam '''
+    flags = frame_flags(cam, world_boxes([(obj, container)]))
+    return {flag: bool(flags[flag][0]) for flag in flags}
 
 ##### OPS #####
 
@@ -512,19 +1189,29 @@ def set_freestyle(tmp_name):
     linesets = {}
     for ls in [fs for fs in FREESTYLE_SETS if fs in RENDERABLE_STYLES]:
         print('ls', ls)
-        linesets[ls] = FREESTYLE_SETTINGS.linesets.new(tmp_name + '_' + ls)
-        linesets[ls].show_render = False
-        linesets[ls].select_by_collection = True
-        linesets[ls].collection = bpy.data.collections[tmp_name]
-        linesets[ls].visibility = FREESTYLE_SETS[ls]['visibility']
-        linesets[ls].select_silhouette = FREESTYLE_SETS[ls]['silhouette']
-        linesets[ls].select_border = FREESTYLE_SETS[ls]['border']
-        linesets[ls].select_contour = FREESTYLE_SETS[ls]['contour']
-        linesets[ls].select_crease = FREESTYLE_SETS[ls]['crease']
-        linesets[ls].select_edge_mark = FREESTYLE_SETS[ls]['mark']
+        linesets[ls] = new_lineset(tmp_name + '_' + ls, ls, 
+                bpy.data.collections[tmp_name])
 
     return linesets
 
+def new_lineset(name, ls, collection, linestyle = None):
+    ''' Create a lineset for style ls selecting objects in collection '''
+    lineset = FREESTYLE_SETTINGS.linesets.new(name)
+    if linestyle:
+        default_linestyle = lineset.linestyle
+        lineset.linestyle = linestyle
+        bpy.data.linestyles.remove(default_linestyle)
+    lineset.show_render = False
+    lineset.select_by_collection = True
+    lineset.collection = collection
+    lineset.visibility = FREESTYLE_SETS[ls]['visibility']
+    lineset.select_silhouette = FREESTYLE_SETS[ls]['silhouette']
+    lineset.select_border = FREESTYLE_SETS[ls]['border']
+    lineset.select_contour = FREESTYLE_SETS[ls]['contour']
+    lineset.select_crease = FREESTYLE_SETS[ls]['crease']
+    lineset.select_edge_mark = FREESTYLE_SETS[ls]['mark']
+    return lineset
+
 def get_render_args():
     ''' Get cameras and object based on args or selection '''
     selection = bpy.context.selected_objects
@@ -576,33 +1263,33 @@ def prepare_files(folder_path, cam_name):
 
     return existing_files
 
-def viewed_objects(cam, objs):
-    """ Filter objects to collect """
-    objects = []
-    frontal_objs = []
-    behind_objs = []
+def get_referenced_objects(objs):
+    ''' Map every renderable object to the objects it is made of '''
     referenced_objs = {}
     ## Use indicate objects (as args or selected) if any. Else use selectable
     objs = objs if len(objs) else bpy.context.selectable_objects 
     for obj in objs:
         if obj.type in RENDERABLES:
             if obj.type == 'EMPTY' and obj.instance_collection:
-                referenced_objs[obj] = obj.instance_collection.all_objects
+                referenced_objs[obj] = get_collection_index(
+                        obj.instance_collection).objects
             elif obj.type != 'EMPTY':
                 referenced_objs[obj] = [obj]
-    for ref_obj in referenced_objs:
-        for obj in referenced_objs[ref_obj]:
-            framed = in_frame(cam, obj, ref_obj)
-            if framed['framed'] and ref_obj not in objects:
-                objects.append(ref_obj)
-            if framed['frontal'] and ref_obj not in frontal_objs:
-                frontal_objs.append(ref_obj)
-            if framed['behind'] and ref_obj not in behind_objs:
-                behind_objs.append(ref_obj)
-            if ref_obj in objects and ref_obj in frontal_objs and \
-                    ref_obj in behind_objs:
-                        break
-    return {'all': objects, 'frontal': frontal_objs, 'behind': behind_objs}
+    return referenced_objs
+
+def viewed_objects(cam, scene_index):
+    """ Filter objects to collect """
+    flags = scene_index.query(cam)
+
+    ## A referencing object gets the flags of any of its objects: pairs of
+    ## every indexed entry are contiguous
+    if not scene_index.entries:
+        return {'all': [], 'frontal': [], 'behind': []}
+    entries = {flag: [scene_index.entries[i] for i in np.flatnonzero(
+        np.logical_or.reduceat(flags[flag], scene_index.starts))] 
+        for flag in flags}
+    return {'all': entries['framed'], 'frontal': entries['frontal'], 
+            'behind': entries['behind']}
 
 def get_non_case_sensitive_same_name(cam):
     ''' Check if same name objects are present in object to render
@@ -627,8 +1314,8 @@ def get_non_case_sensitive_same_name(cam):
     return same_name
 
 
-def main():
-
+def set_render():
+    ''' Set render to get Freestyle svg only '''
     bpy.context.scene.render.resolution_x = RENDER_FACTOR * 1000
     bpy.context.scene.render.resolution_y = RENDER_FACTOR * 1000
     bpy.context.scene.render.engine = 'BLENDER_WORKBENCH'
@@ -636,75 +1323,231 @@ def main():
     bpy.context.scene.render.use_freestyle = True
     bpy.context.scene.svg_export.use_svg_export = True
 
-    tmp_name = create_tmp_collection()
-    fs_linesets = set_freestyle(tmp_name)
-    render_args = get_render_args()
-    print('fs_linesets', fs_linesets)
-
-    objs = render_args['objs']
+def get_cams(render_args):
+    ''' Create Cam objects with the objects they view '''
+    scene_index_start = time.time()
+    scene_index = SceneIndex(render_args['objs'])
+    scene_index_end = time.time()
     cams = []
-    ## Create Cam objetcs
     for cam in render_args['cams']:
         cam_name = undotted(cam.name)
         folder_path = (RENDER_PATH + os.sep + cam_name).strip(os.sep)
         print('folder path', folder_path)
-        cams.append(Cam(
-            cam, cam_name, folder_path, 
-            prepare_files(folder_path, cam_name),
-            viewed_objects(cam, objs)))
-        print('objects are', cams[-1].objects)
+        existing_files = prepare_files(folder_path, cam_name)
+        culling_start = time.time()
+        cams.append(Cam(cam, cam_name, folder_path, existing_files,
+            viewed_objects(cam, scene_index)))
+        print('Objects to render are:\n', [ob.name for ob in cams[-1].objects])
+        print('Frontal are:\n', [ob.name for ob in cams[-1].frontal_objects])
+        print('Behind are:\n', [ob.name for ob in cams[-1].behind_objects])
+        if not WORKER_ADDRESS:
+            cams[-1].events.write('scene_index', start=scene_index_start, 
+                    end=scene_index_end, boxes=len(scene_index.pairs))
+            cams[-1].events.write('culling', start=culling_start, 
+                    objects=[ob.name for ob in cams[-1].objects],
+                    frontal=[ob.name for ob in cams[-1].frontal_objects],
+                    behind=[ob.name for ob in cams[-1].behind_objects])
+    if SAME_MARKER in FLAGS:
+        ## Any object rendered can cover an instance
+        rendered_index = SceneIndex([ob for ob in bpy.context.scene.objects 
+            if ob.type in RENDERABLES and not ob.hide_render])
+        for cam in cams:
+            cam.find_copies(rendered_index)
+    return cams
+
+def set_back_render(back):
+    ''' Disable renderability for all objects to perform back renderings 
+        (or reset to original rendering condition) '''
+    for obj in bpy.context.selectable_objects:
+        obj.hide_render = back or obj in DISABLED_OBJS
 
+def render_cams(cams, tmp_name, fs_linesets):
+    ''' Render every object viewed by cams '''
     for cam in cams:
-        same_name_objects = get_non_case_sensitive_same_name(cam)
-        if same_name_objects:
-            print('The following objects have the same name for non ' + \
-                    'case-sensitive os. \nPlease fix it before continuing')
-            print(same_name_objects)
-            return
-        print('Objects to render are:\n', [ob.name for ob in cam.objects])
-        print('Frontal are:\n', [ob.name for ob in cam.frontal_objects])
-        print('Behind are:\n', [ob.name for ob in cam.behind_objects])
-        status_file = open(folder_path + os.sep + STATUS, 'w')
-        status_file.write('\nObjects to render are {}:\n{}'.format(
-            len(cam.objects), [ob.name for ob in cam.objects]))
-        status_file.write('\nFrontal objects are {}:\n{}'.format(
-            len(cam.frontal_objects), [ob.name for ob in cam.frontal_objects]))
-        status_file.write('\nBehind objects are {}:\n{}'.format(
-            len(cam.behind_objects), [ob.name for ob in cam.behind_objects]))
         cam.set_resolution()
         cam.create_cut()
-        status_file.write('\nCut objects are {}:\n{}'.format(
-            len(cam.cut_objects), [ob.name for ob in cam.cut_objects]))
-        status_file.close()
+        frontal_linesets = {fs_ls:fs_linesets[fs_ls] 
+                for fs_ls in fs_linesets if fs_ls != 'bak'}
+        if SINGLE_RENDER_MARKER in FLAGS:
+            cam.render_all(tmp_name, frontal_linesets, [ob for ob in 
+                cam.frontal_objects if ob not in DISABLED_OBJS])
+            cam.delete_cut()
+            cam.track_memory()
+            continue
         for i, obj in enumerate([ob for ob in cam.frontal_objects 
                 if ob not in DISABLED_OBJS], start=1):
-            status_file = open(folder_path + os.sep + STATUS, 'a')
-            status_file.write('\nRender {}, object #{}/{} ({}%)'.format(
+            print('Render {}, object #{}/{} ({}%)'.format(
                 obj.name, i, len(cam.frontal_objects), 
                 round(100 * float(i)/len(cam.frontal_objects), 2)))
-            status_file.close()
-            cam.render(tmp_name, {fs_ls:fs_linesets[fs_ls] 
-                for fs_ls in fs_linesets if fs_ls != 'bak'}, obj)
+            cam.render(tmp_name, frontal_linesets, obj)
+            cam.track_memory()
         cam.delete_cut()
+        cam.track_memory()
 
-    ## Disable renderability for all objects to perform back renderings
-    for obj in bpy.context.selectable_objects:
-        obj.hide_render = True
+    set_back_render(True)
     ## Render back views
     if 'bak' in fs_linesets.keys():
         for cam in cams:
             cam.set_resolution()
             cam.set_back()
-            for obj in [ob for ob in cam.behind_objects if ob not in DISABLED_OBJS]:
+            behind_objects = [ob for ob in cam.behind_objects 
+                    if ob not in DISABLED_OBJS]
+            ## Back views render every object alone (also with -single): 
+            ## in one pass they would occlude each other
+            for obj in behind_objects:
                 cam.render(tmp_name, {'bak':fs_linesets['bak']}, obj)
+                cam.track_memory()
             cam.set_back()
-    ## Reset to original rendering condition
-    for obj in bpy.context.selectable_objects:
-        obj.hide_render = False if obj not in DISABLED_OBJS else True
+    set_back_render(False)
+
+def render_budgeted(cams, tmp_name, fs_linesets):
+    ''' Render cams one by one while memory stays under MEMORY_BUDGET. 
+        Return the cams rendered here and the batches of names of the 
+        remaining ones '''
+    for i, cam in enumerate(cams, start=1):
+        render_cams([cam], tmp_name, fs_linesets)
+        print('Memory after', cam.name, round(get_rss()), 'MB')
+        if get_rss() > MEMORY_BUDGET and cams[i:]:
+            batch_size = max(1, i // 2)
+            print('Memory budget exceeded: render', len(cams[i:]), 
+                    'cameras in batches of', batch_size)
+            names = [cam.obj.name for cam in cams[i:]]
+            return cams[:i], [names[j:j + batch_size] 
+                    for j in range(0, len(names), batch_size)]
+    return cams, []
+
+def exec_batches(batches):
+    ''' Replace this process with a shell rendering batches (lists of camera
+        names) one after the other in background Blender processes: memory 
+        of this process is released before they load the file '''
+    cam_args = [arg for arg in RENDERABLE_ARGS if arg in bpy.data.objects 
+            and bpy.data.objects[arg].type == 'CAMERA']
+    args = [arg for arg in ARGS if arg not in cam_args]
+    commands = []
+    for batch in batches:
+        commands.append('echo ' + shlex.quote('Render batch ' + str(batch)))
+        commands.append(' '.join(shlex.quote(arg) for arg in [
+            bpy.app.binary_path, '--background', bpy.data.filepath, 
+            '--python', os.path.realpath(__file__), '--'] + args + batch))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execv('/bin/sh', ['sh', '-c', '; '.join(commands)])
+
+def get_jobs(cams, fs_linesets):
+    ''' Split renders of cams in (camera, object, linesets) jobs: back 
+        renders go last '''
+    frontal_linesets = tuple(ls for ls in fs_linesets if ls != 'bak')
+    jobs = [(cam.name, obj.name, frontal_linesets) for cam in cams 
+            for obj in cam.frontal_objects if obj not in DISABLED_OBJS]
+    if 'bak' in fs_linesets:
+        jobs += [(cam.name, obj.name, ('bak',)) for cam in cams 
+                for obj in cam.behind_objects if obj not in DISABLED_OBJS]
+    return jobs
+
+def coordinate(cams, fs_linesets):
+    ''' Let JOBS background Blender workers render cams and collect the 
+        svgs they produce '''
+    jobs = get_jobs(cams, fs_linesets)
+    address, results_queue = work_queue.serve(jobs)
+    jobs_index = ARGS.index(JOBS_MARKER)
+    worker_args = ARGS[:jobs_index] + ARGS[jobs_index + 2:]
+    print('Render', len(jobs), 'jobs with', JOBS, 'workers')
+    return_codes = work_queue.run_blender_workers(JOBS, bpy.app.binary_path, 
+            bpy.data.filepath, os.path.realpath(__file__), worker_args, address)
+
+    cams_by_name = {cam.name: cam for cam in cams}
+    done_jobs = set()
+    for job, svgs, render_keys in work_queue.get_results(results_queue):
+        cam = cams_by_name[job[0]]
+        cam.svgs.update(svgs)
+        cam.render_keys.update(render_keys)
+        done_jobs.add(job)
+    for cam_name, obj_name, linesets in [job for job in jobs 
+            if job not in done_jobs]:
+        print('Not rendered:', obj_name, 'with style', linesets)
+        cams_by_name[cam_name].events.write('failed', obj_name, 
+                ', '.join(linesets))
+    print('Workers exit codes:', return_codes)
+
+def work(cams, tmp_name, fs_linesets):
+    ''' Render jobs got from coordinator and send back the svgs '''
+    jobs_queue, results_queue = work_queue.connect(WORKER_ADDRESS)
+    cams_by_name = {cam.name: cam for cam in cams}
+    current_cam = None
+    back = False
+    for cam_name, obj_name, linesets in work_queue.get_jobs(jobs_queue):
+        cam = cams_by_name[cam_name]
+        ## Jobs of the same camera come in a row: prepare it just once
+        if 'bak' in linesets and not back or cam != current_cam:
+            if current_cam and back:
+                current_cam.set_back()
+            elif current_cam:
+                current_cam.delete_cut()
+            if 'bak' in linesets and not back:
+                set_back_render(True)
+                back = True
+            cam.set_resolution()
+            if back:
+                cam.set_back()
+            else:
+                cam.create_cut()
+            current_cam = cam
+        cam.render(tmp_name, {ls: fs_linesets[ls] for ls in linesets}, 
+                bpy.data.objects[obj_name])
+        results_queue.put(((cam_name, obj_name, linesets), cam.svgs, 
+            cam.render_keys))
+        cam.svgs = {}
+        cam.render_keys = {}
+    if current_cam and back:
+        current_cam.set_back()
+        set_back_render(False)
+    elif current_cam:
+        current_cam.delete_cut()
+
+def main():
+    set_render()
+    tmp_name = create_tmp_collection()
+    fs_linesets = set_freestyle(tmp_name)
+    render_args = get_render_args()
+    print('fs_linesets', fs_linesets)
+    cams = get_cams(render_args)
+
+    if WORKER_ADDRESS:
+        work(cams, tmp_name, fs_linesets)
+        INSTANCE_POOL.free()
+        return
 
     for cam in cams:
-        cam.finalize()
+        same_name_objects = get_non_case_sensitive_same_name(cam)
+        if same_name_objects:
+            print('The following objects have the same name for non ' + \
+                    'case-sensitive os. \nPlease fix it before continuing')
+            print(same_name_objects)
+            return
 
+    batches = []
+    if JOBS > 1:
+        if SINGLE_RENDER_MARKER in FLAGS:
+            print('Workers render objects one by one:', SINGLE_RENDER_MARKER, 
+                    'is ignored')
+        coordinate(cams, fs_linesets)
+    elif MEMORY_BUDGET:
+        cams, batches = render_budgeted(cams, tmp_name, fs_linesets)
+    else:
+        render_cams(cams, tmp_name, fs_linesets)
+    INSTANCE_POOL.free()
 
-main()
-print("--- %s seconds ---" % (time.time() - start_time))
+    for cam in cams:
+        cam.finalize()
+        cam.events.write('memory', peak_rss=cam.peak_rss)
+        print(cam.name, 'summary:', json.dumps(cam.events.summarize(), 
+            indent=1))
+    if CONVERTER:
+        CONVERTER.shutdown()
+    if batches:
+        exec_batches(batches)
+
+
+if __name__ == '__main__':
+    main()
+    print("--- %s seconds ---" % (time.time() - start_time))
@@ -1,3 +1,3 @@
 #!/bin/bash
 
-~/softwares/blender293/blender --background $1 --python ~/softwares/scripts/projections.py -- $2
+~/softwares/blender293/blender --background $1 --python ~/softwares/scripts/projections.py -- ${@:2}
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019 Marco Ferrara
+
+# License:
+# GNU GPL License
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Purpose:
+# Time the stages of projections.py on a synthetic scene and write the
+# results to a json file to compare runs.
+# Run headless (CPU only), objects of the opened scene are removed:
+# blender --background --factory-startup --python projections_bench.py --
+#   -meshes 200 -instances 20 -cams 2 -cut 0.2 -out bench.json
+
+# Dependencies:
+# - projections.py (https://github.com/marzof/scripts)
+# - ODAFileConverter (svgs are converted to dxf anyway if missing)
+
+import bpy
+import bmesh
+import os, sys
+import json
+import math, random
+import platform
+import shutil, tempfile
+import time
+
+ARGS = [arg for arg in sys.argv[sys.argv.index("--") + 1:]] \
+        if "--" in sys.argv else []
+get_arg = lambda marker, default, cast: cast(ARGS[ARGS.index(marker) + 1]) \
+        if marker in ARGS else default
+
+MESHES = get_arg('-meshes', 100, int)
+INSTANCES = get_arg('-instances', 10, int)
+CAMS = get_arg('-cams', 1, int)
+CUT_SHARE = get_arg('-cut', 0.2, float)
+RENDERS = get_arg('-renders', None, int) ## Rendered objects per camera
+SEED = get_arg('-seed', 0, int)
+OUTPUT = os.path.realpath(get_arg('-out', 'projections_bench.json', str))
+KEEP = '-keep' in ARGS
+BLOCK_MESHES = 3 ## Meshes of the instanced collection
+OBJECT_SIZE = .1 ## Object size by camera width
+SCENE_DEPTH = 20
+CLIP_DISTANCE = 1
+
+def timed(func, *args):
+    ''' Call func with args and return its result and the elapsed time '''
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def stats(times):
+    ''' Get count, total, mean and max of times '''
+    return {'count': len(times), 'total': sum(times),
+            'mean': sum(times) / len(times) if times else None,
+            'max': max(times) if times else None}
+
+def new_mesh(name, size):
+    ''' Create a random cube or sphere mesh of size '''
+    bm = bmesh.new()
+    if random.random() < .5:
+        bmesh.ops.create_cube(bm, size=size)
+    else:
+        bmesh.ops.create_uvsphere(bm, u_segments=16, v_segments=8,
+                radius=size/2)
+    mesh = bpy.data.meshes.new(name)
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+def get_location(width, size):
+    ''' Get a random location in front of the cameras, crossing their clip
+        plane by CUT_SHARE probability '''
+    x = random.uniform(-width / 2, (CAMS - .5) * width)
+    z = random.uniform(-width / 2, width / 2)
+    y = 0 if random.random() < CUT_SHARE else \
+            random.uniform(size, SCENE_DEPTH)
+    return (x, y, z)
+
+def build_scene(width):
+    ''' Create MESHES meshes, INSTANCES collection instances and CAMS
+        cameras side by side, each viewing a width wide frame '''
+    scene = bpy.context.scene
+    size = width * OBJECT_SIZE
+    for i in range(MESHES):
+        obj = bpy.data.objects.new('mesh_{}'.format(i),
+                new_mesh('mesh_{}'.format(i), size * random.uniform(.5, 1)))
+        obj.location = get_location(width, size)
+        scene.collection.objects.link(obj)
+
+    ## Instanced collection is not linked to the scene
+    block = bpy.data.collections.new('block')
+    for i in range(BLOCK_MESHES):
+        obj = bpy.data.objects.new('block_{}'.format(i),
+                new_mesh('block_{}'.format(i), size / 2))
+        obj.location = (i * size / 2, 0, 0)
+        block.objects.link(obj)
+    for i in range(INSTANCES):
+        obj = bpy.data.objects.new('instance_{}'.format(i), None)
+        obj.instance_type = 'COLLECTION'
+        obj.instance_collection = block
+        obj.location = get_location(width, size)
+        scene.collection.objects.link(obj)
+
+    ## Cameras look at +y and are clipped at y = 0
+    for i in range(CAMS):
+        cam_data = bpy.data.cameras.new('cam_{}'.format(i))
+        cam_data.type = 'ORTHO'
+        cam_data.ortho_scale = width
+        cam_data.clip_start = CLIP_DISTANCE
+        cam_data.clip_end = SCENE_DEPTH + 2 * CLIP_DISTANCE
+        cam = bpy.data.objects.new('cam_{}'.format(i), cam_data)
+        cam.location = (i * width, -CLIP_DISTANCE, 0)
+        cam.rotation_euler = (math.pi / 2, 0, 0)
+        scene.collection.objects.link(cam)
+
+    for obj in scene.objects:
+        obj.select_set(True)
+    bpy.context.view_layer.update()
+
+def bench_cam(projections, cam, scene_index, tmp_name, fs_linesets):
+    ''' Time the stages of cam rendering '''
+    results = {}
+    viewed, results['viewed_objects'] = timed(projections.viewed_objects,
+            cam, scene_index)
+    results['in_frame'] = timed(lambda: [projections.in_frame(cam, obj,
+        container) for obj, container in scene_index.pairs])[1]
+
+    cam_name = projections.undotted(cam.name)
+    existing_files = projections.prepare_files(cam_name, cam_name)
+    cam = projections.Cam(cam, cam_name, cam_name, existing_files, viewed)
+    results.update({'objects': len(cam.objects),
+        'frontal': len(cam.frontal_objects),
+        'behind': len(cam.behind_objects)})
+
+    cam.set_resolution()
+    results['create_cut'] = timed(cam.create_cut)[1]
+    results['cut'] = len(cam.cut_objects)
+    frontal_linesets = {fs_ls:fs_linesets[fs_ls]
+            for fs_ls in fs_linesets if fs_ls != 'bak'}
+    results['render'] = stats([timed(cam.render, tmp_name, frontal_linesets,
+        obj)[1] for obj in cam.frontal_objects[:RENDERS]])
+    cam.delete_cut()
+
+    results['finalize'] = timed(cam.finalize)[1]
+    return results
+
+def main():
+    start = time.perf_counter()
+    random.seed(SEED)
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+
+    ## projections.py reads args and render path on import
+    bench_path = tempfile.mkdtemp(prefix='projections_bench_')
+    os.chdir(bench_path)
+    open('blank.dwg', 'w').close()
+    bpy.context.scene.render.filepath = bench_path
+    sys.argv = sys.argv[:1] + ['--']
+    sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+    import projections
+
+    width = projections.BASE_ORTHO_SCALE
+    results = {'params': {'meshes': MESHES, 'instances': INSTANCES,
+        'cams': CAMS, 'cut': CUT_SHARE, 'renders': RENDERS, 'seed': SEED},
+        'blender': bpy.app.version_string, 'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'cams': {}}
+    results['build_scene'] = timed(build_scene, width)[1]
+
+    projections.set_render()
+    tmp_name = projections.create_tmp_collection()
+    fs_linesets = projections.set_freestyle(tmp_name)
+    render_args = projections.get_render_args()
+    scene_index, results['scene_index'] = timed(projections.SceneIndex,
+            render_args['objs'])
+    for cam in render_args['cams']:
+        print('Bench', cam.name)
+        results['cams'][cam.name] = bench_cam(projections, cam, scene_index,
+                tmp_name, fs_linesets)
+    projections.INSTANCE_POOL.free()
+    results['total'] = time.perf_counter() - start
+
+    with open(OUTPUT, 'w') as output:
+        json.dump(results, output, indent=1)
+    print('Results written to', OUTPUT)
+    if KEEP:
+        print('Renders kept in', bench_path)
+    else:
+        shutil.rmtree(bench_path)
+
+main()
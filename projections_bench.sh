@@ -0,0 +1,3 @@
+#!/bin/bash
+
+~/softwares/blender293/blender --background --factory-startup --python ~/softwares/scripts/projections_bench.py -- $@
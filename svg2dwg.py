@@ -21,7 +21,7 @@
 
 # Dependencies: 
 # - ODAFileConverter
-# - Inkscape
+# - Inkscape 1.x (by inkscape_shell.py)
 # - pstoedit
 
 
@@ -29,13 +29,26 @@ import sys, os
 from pathlib import Path
 import subprocess, shlex
 import re
+import hashlib, json
+import glob
+import time
+import concurrent.futures
+import inkscape_shell
+import file_watch
 
 oda_file_converter = '/usr/bin/ODAFileConverter'
 scale_marker = '-s'
+jobs_marker = '-j'
+watch_marker = '-w'
+poll_marker = '-poll'
+pstoedit_format = 'dxf_14:-polyaslines -ctl -mm'
+dwg_version = 'ACAD2013'
+manifest_name = 'manifest.json'
+output_folder = 'DWGS'
 scale_re = re.compile("([\d,\.]*)[:\/]([\d,\.]*)")
 
-def svg2dwg(path: Path, scale_factor: float) -> None:
-    output_path = Path(path.parents[0]) / "DWGS"
+def svg2dxf(path: Path, scale_factor: float) -> Path:
+    output_path = get_output_path(path)
     output_path.mkdir(parents=True, exist_ok=True)
     filename = path.stem
     svg = str(Path(path.parents[0])) + os.sep + filename + '.svg'
@@ -44,14 +57,11 @@ def svg2dwg(path: Path, scale_factor: float) -> None:
 
     ## Ungroup (multiple times) all before exporting in eps to allow pstoedit 
     ## to read every entities
-    svg2eps_cmd = ['inkscape', '--actions', 'select-all:groups; ' + \
-            'SelectionUnGroup; SelectionUnGroup; SelectionUnGroup; ' + \
-            f'export-filename: {eps}; export-do;', svg]
-    subprocess.run(svg2eps_cmd)
+    inkscape_shell.export(svg, eps, ungroup=True, area=None)
 
     svg2dxf = f"pstoedit -xscale {str(scale_factor)} -yscale {str(scale_factor)}" 
-    svg2dxf += f" -dt -f 'dxf_14:-polyaslines -ctl -mm' {eps} {dxf}"
-    subprocess.run(svg2dxf, shell=True) 
+    svg2dxf += f" -dt -f '{pstoedit_format}' {eps} {dxf}"
+    subprocess.run(svg2dxf, shell=True, check=True) 
     dxf_f = open(dxf, 'r')
     dxf_content = dxf_f.read()
     fixed_dxf_content = re.sub('\$LUNITS.*\n(\s*70).*\n(\s*)4', 
@@ -60,18 +70,73 @@ def svg2dwg(path: Path, scale_factor: float) -> None:
     fixed_dxf = open(dxf, 'w')
     fixed_dxf.write(fixed_dxf_content)
     fixed_dxf.close()
+    os.remove(eps)
+    return Path(dxf)
 
+def convert(path: Path, scale_factor: float) -> tuple:
+    ''' Convert path to dxf and get (dxf or None, error, seconds) '''
+    start = time.time()
+    try:
+        return svg2dxf(path, scale_factor), None, time.time() - start
+    except Exception as e:
+        return None, str(e), time.time() - start
+
+def dxfs2dwgs(output_path: Path) -> None:
+    ''' Convert every dxf of output_path by a single ODAFileConverter run '''
     subprocess.run([oda_file_converter, output_path, output_path,
-        'ACAD2013', 'DWG', '1', '1', filename + '.dxf'])
-    subprocess.run(['rm', eps, dxf])
+        dwg_version, 'DWG', '0', '1', '*.dxf'])
+    for dxf in output_path.glob('*.dxf'):
+        os.remove(dxf)
+
+def get_output_path(path: Path) -> Path:
+    ''' Get the folder of dwgs converted from path '''
+    return Path(path.parents[0]) / output_folder
+
+def get_mtime(path: Path) -> int:
+    ''' Get modification time of path (None if missing) '''
+    return path.stat().st_mtime_ns if path.exists() else None
+
+def get_key(path: Path, scale_factor: float) -> str:
+    ''' Hash svg content, scale factor and converter options '''
+    hash_obj = hashlib.sha1(path.read_bytes())
+    hash_obj.update(json.dumps([scale_factor, inkscape_shell.UNGROUP, 
+        pstoedit_format, dwg_version]).encode())
+    return hash_obj.hexdigest()
+
+def load_manifest(output_path: Path) -> dict:
+    ''' Get svg names and keys of dwgs in output_path '''
+    manifest_path = output_path / manifest_name
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path) as manifest:
+        return json.load(manifest)
+
+def save_manifest(output_path: Path, manifest: dict) -> None:
+    with open(output_path / manifest_name, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
 
+def get_svgs(items: list) -> list:
+    ''' Get svg files from files, directories and glob patterns '''
+    svgs = []
+    for item in items:
+        if os.path.isdir(item):
+            paths = sorted(Path(item).glob('*.svg'))
+        elif any(char in item for char in '*?['):
+            paths = [Path(f) for f in sorted(glob.glob(item))]
+        else:
+            paths = [Path(item)]
+        svgs += [path for path in paths if path not in svgs]
+    return svgs
 
 def main():
     args = [arg for arg in sys.argv] #[sys.argv.index("--") + 1:]]
     if len(args) == 1:
         ## Just the command has been given
-        print('Enter a scale factor with -s flag and an svg file to convert')
-        print('For example: svg2dwg -s 1:50 drawing.svg')
+        print('Enter a scale factor with -s flag and svg files, folders ' + \
+                'or patterns to convert (-j to set parallel conversions)')
+        print('For example: svg2dwg -s 1:50 drawing.svg sheets/ "plans/*.svg"')
+        print('Add -w to keep converting svgs saved in the folders given ' + \
+                '(-poll to watch network shares)')
         return
     if scale_marker in args:
         scale_index = args.index(scale_marker) + 1 
@@ -82,11 +147,125 @@ def main():
             base_scale_factor = float(args[scale_index])
         scale_factor = 1 / (base_scale_factor * 10)
         print('Scale_factor:', scale_factor)
+        del args[scale_index - 1 : scale_index + 1]
     else:
         scale_factor = 1
-    f = sys.argv[-1]
-    path = Path(f)
+    jobs = os.cpu_count() or 1
+    if jobs_marker in args:
+        jobs_index = args.index(jobs_marker) + 1
+        jobs = int(args[jobs_index])
+        del args[jobs_index - 1 : jobs_index + 1]
+    watching = watch_marker in args
+    polling = poll_marker in args
+    args = [arg for arg in args if arg not in (watch_marker, poll_marker)]
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        if watching:
+            watch_svgs(args[1:], scale_factor, executor, polling)
+        else:
+            convert_svgs(get_svgs(args[1:]), scale_factor, executor)
+
+def convert_svgs(paths: list, scale_factor: float, 
+        executor: concurrent.futures.Executor) -> None:
+    ''' Convert paths not converted yet by executor and print a summary '''
+    start = time.time()
+    results = {}
+    manifests = {}
+    keys = {}
+    cached = []
+    for path in paths:
+        output_path = get_output_path(path)
+        if output_path not in manifests:
+            manifests[output_path] = load_manifest(output_path)
+        try:
+            keys[path] = get_key(path, scale_factor)
+        except OSError as e:
+            results[path] = None, str(e), 0
+            continue
+        ## Skip svgs converted with same content, scale and options
+        if manifests[output_path].get(path.name) == keys[path] and \
+                (output_path / (path.stem + '.dwg')).exists():
+            cached.append(path)
+            results[path] = None, None, 0
+    to_convert = [path for path in paths if path not in results]
+    ## Dwgs of previous runs, to tell them from the ones converted now
+    old_dwgs = {path: get_mtime(get_output_path(path) / (path.stem + '.dwg'))
+            for path in to_convert}
+    futures = {executor.submit(convert, path, scale_factor): path 
+            for path in to_convert}
+    for future in concurrent.futures.as_completed(futures):
+        results[futures[future]] = future.result()
+        print('Converted' if results[futures[future]][0] else 'FAILED', 
+                futures[future])
+
+    ## One ODAFileConverter run per output folder
+    output_paths = {dxf.parent for dxf, error, seconds in results.values() 
+            if dxf}
+    for output_path in output_paths:
+        dxfs2dwgs(output_path)
+
+    print('\n### Summary')
+    done = 0
+    for path in paths:
+        dxf, error, seconds = results[path]
+        if dxf and get_mtime(dxf.with_suffix('.dwg')) in (None, 
+                old_dwgs[path]):
+            error = 'no dwg from ODAFileConverter'
+        manifest = manifests[get_output_path(path)]
+        if error:
+            manifest.pop(path.name, None)
+        else:
+            manifest[path.name] = keys[path]
+        done += not error
+        status = 'CACHED' if path in cached else 'FAILED' if error else 'OK'
+        print('{:6} {:8.1f} s  {}{}'.format(status, seconds, path, 
+            '  ' + error if error else ''))
+    for output_path in manifests:
+        if output_path.exists():
+            save_manifest(output_path, manifests[output_path])
+    print('{}/{} files converted ({} unchanged) in {:.1f} s'.format(done, 
+        len(paths), len(cached), time.time() - start))
+
+def remove_dwgs(paths: list) -> None:
+    ''' Remove dwgs (and their manifest keys) converted from deleted paths '''
+    for output_path in {get_output_path(path) for path in paths}:
+        manifest = load_manifest(output_path)
+        for path in paths:
+            if get_output_path(path) != output_path or \
+                    path.name not in manifest:
+                continue
+            dwg = output_path / (path.stem + '.dwg')
+            print('Remove', dwg)
+            if dwg.exists():
+                os.remove(dwg)
+            manifest.pop(path.name)
+        if output_path.exists():
+            save_manifest(output_path, manifest)
+
+def watch_svgs(folders: list, scale_factor: float, 
+        executor: concurrent.futures.Executor, polling: bool = False) -> None:
+    ''' Keep dwgs of folders in sync with their svgs until interrupted '''
+    folders = [os.path.abspath(folder) for folder in folders]
+    for folder in folders:
+        if not os.path.isdir(folder):
+            print(folder, 'is not a folder to watch')
+            return
+    ## Sync dwgs of svgs changed or deleted while not watching
+    convert_svgs(get_svgs(folders), scale_factor, executor)
+    remove_dwgs([Path(folder) / name for folder in folders 
+        for name in load_manifest(Path(folder) / output_folder)
+        if not (Path(folder) / name).exists()])
 
-    svg2dwg(path, scale_factor)
+    print('\nWatch', ', '.join(folders), '(Ctrl+C to stop)')
+    try:
+        for changes in file_watch.watch(folders, '.svg', polling=polling):
+            paths = sorted(Path(change) for change in changes)
+            remove_dwgs([path for path in paths if not path.exists()])
+            saved = [path for path in paths if path.exists()]
+            if saved:
+                convert_svgs(saved, scale_factor, executor)
+    except KeyboardInterrupt:
+        print('Stop watching')
 
-main()
+if __name__ == '__main__':
+    main()
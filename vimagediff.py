@@ -23,16 +23,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Dependencies: 
-# - imagediff.sh (https://github.com/marzof/scripts)
+# - imagediff.py (https://github.com/marzof/scripts)
 # - git
 
-import sys
+import sys, os
 import subprocess, shlex
 import tempfile
-from pathlib import Path
 
-home = str(Path.home())
-imagediff = home + "/softwares/scripts/imagediff.sh"
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import imagediff
+
 resolution_marker = '-r'
 args = sys.argv[1:]
 resolution = '72'
@@ -82,7 +82,7 @@ def main():
     ## Simple comparison between two files
     if len(base_files) == 2 and ':' not in ' '.join(base_files):
         files = base_files
-        subprocess.run([imagediff] + files + [resolution])  
+        imagediff.imagediff(*files, resolution)
         return
         
     ## Versioning comparison
@@ -111,6 +111,6 @@ def main():
     if not temp_file[1]:
         files.append(path[0])
 
-    subprocess.run([imagediff] + files + [resolution])  
+    imagediff.imagediff(*files, resolution)
 
 main()
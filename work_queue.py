@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2019 Marco Ferrara
+
+# License:
+# GNU GPL License
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Purpose:
+# Hand out jobs to headless Blender workers started by a coordinator script
+# and collect their results. The coordinator serves the queues, the workers
+# get the address from the command line.
+
+import os
+import queue
+import subprocess
+import threading
+from multiprocessing.managers import BaseManager
+
+HOST = '127.0.0.1'
+WORKER_MARKER = '-worker'
+
+class JobsManager(BaseManager):
+    ''' Share jobs and results queues between processes '''
+    pass
+
+def serve(jobs):
+    ''' Serve jobs in a background thread and return the address to give
+        to workers and the queue receiving their results '''
+    jobs_queue = queue.Queue()
+    results_queue = queue.Queue()
+    for job in jobs:
+        jobs_queue.put(job)
+    JobsManager.register('get_jobs', callable=lambda: jobs_queue)
+    JobsManager.register('get_results', callable=lambda: results_queue)
+    authkey = os.urandom(16).hex()
+    manager = JobsManager(address=(HOST, 0), authkey=authkey.encode())
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = '{}:{}:{}'.format(server.address[0], server.address[1], authkey)
+    return address, results_queue
+
+def connect(address):
+    ''' Get jobs and results queues served at address '''
+    host, port, authkey = address.split(':')
+    JobsManager.register('get_jobs')
+    JobsManager.register('get_results')
+    manager = JobsManager(address=(host, int(port)), authkey=authkey.encode())
+    manager.connect()
+    return manager.get_jobs(), manager.get_results()
+
+def get_jobs(jobs_queue):
+    ''' Yield jobs until the queue is empty '''
+    while True:
+        try:
+            yield jobs_queue.get_nowait()
+        except queue.Empty:
+            return
+
+def get_results(results_queue):
+    ''' Get all results put in the queue so far '''
+    results = []
+    while True:
+        try:
+            results.append(results_queue.get_nowait())
+        except queue.Empty:
+            return results
+
+def run_blender_workers(count, blender, blend, script, args, address):
+    ''' Start count background Blender processes running script on blend
+        and wait for them to finish '''
+    cmd = [blender, '--background', blend, '--python', script,
+            '--'] + args + [WORKER_MARKER, address]
+    workers = [subprocess.Popen(cmd) for i in range(count)]
+    for worker in workers:
+        worker.wait()
+    return [worker.returncode for worker in workers]